@@ -1,20 +1,23 @@
 import pandas as pd
 import numpy as np
-import json 
-import requests
-import subprocess
-import math
 from os import path
 import os
 import re
 import tarfile
 import sys
+import GDCDownload
+import GDCQuery
 
 
 '''
 Usage Instructions: 
 Command Line:
 [This file name] [Xena-GDC-ETL imported .tsv file name]
+[This file name] [xena file 1],[xena file 2],...
+
+The type of copy number data of each xena file is read from the end of its name (see xena_suffix in cnv_file_types). Several
+xena files can be given separated by commas: the GDC files of all of them are found with one query and downloaded together,
+and each is validated against its own xena file. A file whose name does not match any type is validated as ascat-ngs.
 
 example: python3 XenaGDC/CopyNumberTesting.py /Users/Downloads/CGCI-HTMCP-LC.cnv_ascat-ngs.tsv
 '''
@@ -24,259 +27,348 @@ example: python3 XenaGDC/CopyNumberTesting.py /Users/Downloads/CGCI-HTMCP-LC.cnv
 #### CONSTANTS ########################################
 # example file:
 #xena_file = "/Users/michaeltellis/Downloads/CGCI-HTMCP-LC.cnv_ascat-ngs.tsv"
-xena_file = sys.argv[1]
+xena_files = sys.argv[1].split(",")
 keyword = ["files", "samples", "Chrom", "Start", "End", "value"]
-cases_endpt = "https://api.gdc.cancer.gov/cases"
-file_endpt = "https://api.gdc.cancer.gov/files"
-fileRequestFields = "files.file_name"# The field we are searching for is the file name
-fileRequestSearch = 'copy_number_variation.seg.txt' # search is a string that we check in each file name we get, and if it matches, the file name is put in a list called file_list.
-fileRequestKeys = ["files"]  # We only want the file names from our response and so we only search inside values with keys named 'files'
-downloadFilesFields = "file_id"
-orderedSamplesFields = ["samples.submitter_id", "files.file_id"] # The field we are searching for is the file name
+fileRequestFilters = {"data_category": "Copy Number Variation", "data_format": "TXT"} # only files matching these fields are requested from the GDC
+allele_columns = ["Major_Copy_Number", "Minor_Copy_Number"] # the two copy numbers of an allele specific seg file, which add up to value
+# CNV file types that can be validated. For each type: a regular expression that the GDC file name must match (files that match
+# no type are not used), the columns of the GDC seg file after the aliquot, and the end of the name of the xena file of that type.
+# Columns that are also in the xena file are compared, and allele_columns are checked to add up to value.
+cnv_file_types = {
+	"ascat-ngs": {"pattern": r"copy_number_variation\.seg\.txt$", "columns": keyword[2:6] + allele_columns, "xena_suffix": "cnv_ascat-ngs.tsv"},
+	"ascat2": {"pattern": r"ascat2\.allelic_specific\.seg\.txt$", "columns": keyword[2:6] + allele_columns, "xena_suffix": "allele_cnv_ascat2.tsv"},
+	"ascat3": {"pattern": r"ascat3\.allelic_specific\.seg\.txt$", "columns": keyword[2:6] + allele_columns, "xena_suffix": "allele_cnv_ascat3.tsv"},
+	"masked": {"pattern": r"nocnv_grch38\.seg\.v2\.txt$", "columns": keyword[2:5] + ["Num_Probes", "value"], "xena_suffix": "masked_cnv_DNAcopy.tsv"},
+	"unmasked": {"pattern": r"(?<!nocnv_)grch38\.seg\.v2\.txt$", "columns": keyword[2:5] + ["Num_Probes", "value"], "xena_suffix": "cnv_DNAcopy.tsv"}
+}
+default_file_type = "ascat-ngs" # type of a xena file whose name does not end with any xena_suffix
+stream_download = True # when True the GDC bundle is parsed in memory as it downloads, when False it is saved and extracted to disk first.
+cache_dir = None # directory where downloaded GDC files are cached by file id and md5sum, None turns the cache off.
+cache_size = 50 * 1000 ** 3 # bytes the cache can hold before the least recently used files are removed.
+join_segments = False # when True segments are matched by (sample, Chrom, Start, End) instead of by row, so the order of the rows does not matter.
+segment_keys = ["sample", "Chrom", "Start", "End"] # columns that identify a segment when join_segments is True
+mismatch_rows = 20 # number of differing segments printed at the end, the per-column summary always covers every sample.
 
 ### Globals #######################################################################
-xena_df = pd.read_csv(xena_file, sep="\t")
-sample = []
-file_names = []
+xena_dfs = {} # file type -> dataframe of its xena file
+samples = {} # file type -> samples of its xena file
+manifest = pd.DataFrame()
+sample_rows = {} # file type -> sample -> [first row, last row + 1] of its segments in the xena file, built once by sampleIndex()
+
+'''
+fileType is the CNV file type of a xena file, the type with the longest xena_suffix that the file name ends with (so that
+masked_cnv_DNAcopy.tsv is not taken for cnv_DNAcopy.tsv).
+'''
+def fileType(xena_file):
+	matches = [cnv_type for cnv_type, file_type in cnv_file_types.items() if xena_file.endswith(file_type["xena_suffix"])]
+	if len(matches) == 0:
+		return default_file_type
+	return max(matches, key = lambda cnv_type: len(cnv_file_types[cnv_type]["xena_suffix"]))
+
+'''
+gdcFileType is the CNV file type of a GDC file name, None if it matches none of them.
+'''
+def gdcFileType(file_name):
+	for cnv_type, file_type in cnv_file_types.items():
+		if re.search(file_type["pattern"], file_name):
+			return cnv_type
+	return None
 
-print(xena_df)
 def sample(df):
-	samples = df["sample"].tolist()
-	sample_list = []
-	[sample_list.append(x) for x in samples if x not in sample_list]
+	sample_list = df["sample"].drop_duplicates().tolist() # every sample once, in the order of the file
 	print(sample_list)
 	return sample_list
 
+'''
+sampleIndex builds, in one pass over the sample column, a dictionary from each sample to the range of rows [start, stop) that hold its
+segments in df, so each sample is found in constant time instead of searching the whole dataframe. The segments of a sample are expected
+to be next to each other, and samples whose rows are spread out are printed.
+'''
+def sampleIndex(df):
+	positions = pd.Series(np.arange(len(df))).groupby(df["sample"].to_numpy(), sort = False)
+	first = positions.min()
+	last = positions.max()
+	count = positions.size()
+	scattered = count.index[(last - first + 1) != count]
+	if len(scattered) > 0:
+		print("samples whose segments are not in consecutive rows of the xena file:")
+		print(list(scattered))
+	index = {}
+	for sample_name, start, stop in zip(first.index, first.to_numpy(), last.to_numpy() + 1):
+		index[sample_name] = [int(start), int(stop)]
+	return index
 
-def unpeel(resJson):
-    resJson = json.loads(resJson)
-    resJson = resJson.get("data")
-    resJson = resJson.get("hits")
-    return resJson
-
-
-def fileRequest(fields, search, keys, sample_list, cases_endpt):
-	file_list = [] 
-	filters = {
-		"op": "in",
-		"content":{
-			"field": "samples.submitter_id",
-			"value": sample_list
-		}
-	}
-
-	params = {
-		"filters": json.dumps(filters),
-		"fields": fields,
-		"format": "json",
-		"size": "20000"
-	}
-	    
-	response = requests.post(cases_endpt, headers = {"Content-Type": "application/json"},  json = params)
-	responseJson = json.dumps(response.json(),indent=2)
-	responseJson = unpeel(responseJson)
-	print(responseJson)
-
-	for i in responseJson: # i is a dictionary in the responseJson list which correspondes to a single sample.  
-		item = [] 
-		for key, value in i.items(): 
-			if key in keys: # if this specific key in i is equal to 'files', then its value will be the list, item. 
-				item = value # item now is a list of the file names of all files in a specific sample (as well as the sample ids.)
-				for i in item:
-					file = i["file_name"] # each element in the item list is a dictionary and if that dictionary's key is 'file_name' 
-					if file.find(search) != -1: # then we check if the value( file name) matches our search string.
-						file_list.append(file) # if it does, it is appended to a new list of the files we want to download. 
-						break
-				break
-	print(file_list)
-	return file_list
-
-def downloadFiles(fields, file_endpt, file_list):
-	file_id_list = [] # file_id_list will be a list containing all the file ids.
-	filters = {
-		"op": "in",
-		"content":{
-			"field": "file_name",
-			"value": file_list
-			}
-	}
-
-	params = {
-		"filters": json.dumps(filters),
-		"fields": fields,
-		"format": "json",
-		"size": "100"
-		}
-
-	response = requests.post(file_endpt, headers = {"Content-Type": "application/json"},  json = params)
-	#response is the Json response we get from the GDC after sending a POST request.
-
-	#response Json is response in a more readable format. 
-	responseJson = json.dumps(response.json(),indent=2)
-	responseJson = unpeel(responseJson)
-	for i in responseJson: # i is a dictionary containing a key called 'file_id' and a value that is the file id. 
-		file = i["file_id"]
-		file_id_list.append(file) # we append the value of i to file_id_list. 
-	print(file_id_list)
 
-	payload = {"ids": file_id_list}
+'''
+getManifest resolves the copy number files of the samples of every file type in sample_lists (file type -> samples) with a single
+paginated query to the files endpoint. Each file is given the type that its name matches, and only the files of a type that is
+validated, and of a sample in that type's xena file, are kept. It returns a dataframe with the sample, file id, file name, md5sum,
+file size and type of every file.
+'''
+def getManifest(sample_lists):
+	all_samples = list(dict.fromkeys(sample_name for sample_list in sample_lists.values() for sample_name in sample_list))
+	manifest = GDCQuery.resolveManifest(all_samples, fileRequestFilters)
+	manifest["type"] = [gdcFileType(file_name) for file_name in manifest["file_name"]]
+	unknown = manifest[manifest["type"].isna()]
+	if len(unknown) > 0:
+		print("\nfiles of these samples that match no CNV file type, they are not used (" + str(len(unknown)) + "):")
+		print(unknown["file_name"].drop_duplicates().tolist())
+	wanted = set()
+	for cnv_type, sample_list in sample_lists.items():
+		wanted.update((cnv_type, sample_name) for sample_name in sample_list)
+	keep = [(cnv_type, sample_name) in wanted for cnv_type, sample_name in zip(manifest["type"], manifest["sample"])]
+	manifest = manifest[keep].reset_index(drop = True)
+	print(manifest)
+	return manifest
 
-	with open("request.txt", "w") as request: # writes payload to a txt file called request.txt
-		request.write(str(payload).replace("\'", "\""))
-	subprocess.run(["curl", "-o", "gdc_download.tar.gz", "--remote-name", "--remote-header-name", "--request", "POST", "--header", "Content-Type: application/json", "--data", "@request.txt", 'https://api.gdc.cancer.gov/data'])  
-	gdc_download = tarfile.open("gdc_download.tar.gz")
+'''
+checkManifest turns the manifest into dictionaries keyed by file id (its sample, type and md5sum), so every later lookup takes constant
+time, and checks it on the way. A sample with more than one file of a type only keeps one (its own file if it has one), a file listed for more than one
+sample (a GDC file can belong to several samples of a case) is only compared with the first of them, and samples of a xena file with no
+GDC file (orphans) are printed, as well as the duplicates. The manifest with one row per file id is returned with the dictionaries.
+'''
+def checkManifest(manifest, sample_lists):
+	# files of a single sample are put first, so a sample that has its own file keeps it rather than a file shared with another sample.
+	file_samples = manifest.groupby("file_id")["sample"].transform("size")
+	manifest = manifest.iloc[np.argsort(file_samples.to_numpy(), kind = "stable")]
+	duplicated = manifest[manifest.duplicated(subset = ["type", "sample"], keep = False)]
+	if len(duplicated) > 0:
+		print("\nsamples with more than one file of the same type, only the first file is compared:")
+		print(duplicated[["type", "sample", "file_id", "file_name"]].to_string(index = False))
+	manifest = manifest.drop_duplicates(subset = ["type", "sample"])
+	shared = manifest[manifest.duplicated(subset = "file_id", keep = False)]
+	if len(shared) > 0:
+		print("\nfiles listed for more than one sample, each is only compared with its first sample:")
+		print(shared[["file_id", "type", "sample"]].to_string(index = False))
+	manifest = manifest.drop_duplicates(subset = "file_id").reset_index(drop = True)
+	uuid_sample = dict(zip(manifest["file_id"], manifest["sample"])) # file id -> sample
+	uuid_type = dict(zip(manifest["file_id"], manifest["type"])) # file id -> CNV file type
+	uuid_md5 = dict(zip(manifest["file_id"], manifest["md5sum"])) # file id -> md5sum
+	for cnv_type, sample_list in sample_lists.items():
+		found = set(manifest["sample"][manifest["type"] == cnv_type])
+		orphans = [sample_name for sample_name in sample_list if sample_name not in found]
+		if len(orphans) > 0:
+			print("\nsamples of the " + cnv_type + " xena file without a GDC file (" + str(len(orphans)) + "):")
+			print(orphans)
+	return manifest, uuid_sample, uuid_type, uuid_md5
+
+'''
+downloadFiles returns the list of file ids in the manifest. In streaming mode, or when the download cache is used, the files are
+downloaded later by compareSamples() as they are compared, and only files missing from the cache are requested. Otherwise the 
+bundle is downloaded and extracted to disk here.
+'''
+def downloadFiles(manifest):
+	file_id_list = manifest["file_id"].unique().tolist() # file_id_list will be a list containing all the file ids.
+	print(file_id_list)
 
-	gdc_download.extractall("gdc_download")
-	gdc_download.close()
+	if stream_download == False and cache_dir == None:
+		GDCDownload.downloadFile(file_id_list, "gdc_download.tar.gz") # chunked download that resumes if it is interrupted
+		gdc_download = tarfile.open("gdc_download.tar.gz")
+
+		gdc_download.extractall("gdc_download")
+		gdc_download.close()
 
 	return file_id_list
 
 
 
-def orderedSamples(cases_endpt, fields,file_id_list):
-	fields = ",".join(fields)
-	file_list = [] 
-	filters = {
-		"op": "in",
-		"content":{
-			"field": "files.file_id",
-			"value": file_id_list
-		}
-	}
-		
-	params = {
-		"filters": json.dumps(filters),
-		"fields": fields,
-		"format": "json",
-		"size": "20000"
-	}
-		    
-	response = requests.post(cases_endpt, headers = {"Content-Type": "application/json"},  json = params)
-	responseJson = json.dumps(response.json(),indent=2)
-	responseJson = unpeel(responseJson)
-	return responseJson
-
-def compareSamples(responseJson, file_id_list, xena_df, sample_list):
-	samples_passed = 0
-	for i in responseJson:
-		marker = None
-		idIndex = None
-		sample = None
-		chromCompare = 0
-		startCompare = 0
-		endCompare = 0
-		valueCompare = 0
-		for key, value in i.items():
-			if key == keyword[0]:
-				for j in value:
-					#print(j)
-					for name, item in j.items():
-						#print(item)
-						if item in file_id_list:
-							idIndex = file_id_list.index(item)
-							break
-							break
-
-		for key, value in i.items():
-			if key == keyword[1]:
-				for j in value:
-					for name, item in j.items():
-						if item in sample_list:
-							sample = item
-							break 
-							break
-		uuid = file_id_list[idIndex]
-		file = os.listdir("gdc_download/" + uuid)
-		data = pd.read_csv("gdc_download/" + uuid + "/" + file[0], sep ='\t', skiprows = 1, index_col=0, header=None)
-		data.columns = ["Chrom", "Start", "End", "value", "", ""]
-		pos = []
-		result = xena_df.isin([sample])
-		seriesObj = result.any()
-		columnNames = list(seriesObj[seriesObj == True].index)
-
-		for col in columnNames:
-			rows = list(result[col][result[col] == True].index)
-			for row in rows:
-				pos = [row, col]
-				break
-			break
-		#print(pos)
-
-		
-		zeroCell = xena_df.loc[pos[0]][pos[1]]
-		print(zeroCell)
-		for item in range(len(data)):
-			cell2Pos = pos[0] + item
-			cell1 = data.iloc[item][keyword[2]]
-			cell2 = xena_df.loc[cell2Pos][keyword[2]]
-			if cell1 == cell2:
-				chromCompare += 1
-			else:
-				print("fail")
-				print(cell1)	
-				print(cell2)
-				print(keyword[2])
-				break
-		for item in range(len(data)):
-			cell2Pos = pos[0] + item
-			cell1 = data.iloc[item][keyword[3]]
-			cell2 = xena_df.loc[cell2Pos][keyword[3]]
-			if cell1 == cell2:
-				startCompare += 1
-			else:
-				print("fail")
-				print(cell1)	
-				print(cell2)
-				print(keyword[3])
-				break
-		for item in range(len(data)):
-			cell2Pos = pos[0] + item
-			cell1 = data.iloc[item][keyword[4]]
-			cell2 = xena_df.loc[cell2Pos][keyword[4]]
-			if cell1 == cell2:
-				endCompare += 1
-			else:
-				print("fail")
-				print(cell1)	
-				print(cell2)
-				print(keyword[4])
-				break
-		for item in range(len(data)):
-			cell2Pos = pos[0] + item
-			cell1 = data.iloc[item][keyword[5]]
-			cell2 = xena_df.loc[cell2Pos][keyword[5]]
-			if cell1 == cell2:
-				valueCompare += 1
-			else:
-				print("fail")
-				print(cell1)	
-				print(cell2)
-				print(keyword[5])
-				break
-		if chromCompare == len(data) and startCompare == len(data) and endCompare == len(data) and valueCompare == len(data):
-			samples_passed += 1
-			print("pass")
-		else: 
-			print("fail")
-
-		print(chromCompare)
-		print(startCompare)
-		print(endCompare)
-		print(valueCompare)
-	if samples_passed == len(sample_list):
+'''
+sameValues compares two columns element by element. Chromosomes are compared as strings, and positions and copy numbers as floats, which
+are exact for whole numbers (so 2 and 2.0 match) and where two missing values count as a match.
+'''
+def sameValues(gdc_column, xena_column, column):
+	if column == keyword[2]:
+		return gdc_column.astype(str).to_numpy() == xena_column.astype(str).to_numpy()
+	gdc_values = gdc_column.to_numpy(dtype = float)
+	xena_values = xena_column.to_numpy(dtype = float)
+	return (gdc_values == xena_values) | (np.isnan(gdc_values) & np.isnan(xena_values))
+
+'''
+compareColumns is the list of columns of a file type that are compared with its xena file, the columns of the GDC seg file that the xena
+file has as well.
+'''
+def compareColumns(cnv_type, xena_df):
+	return [column for column in cnv_file_types[cnv_type]["columns"] if column in xena_df.columns]
+
+'''
+compareSegments compares the GDC segments of one sample (data) with its rows in the xena file (xena_rows), all columns at once and
+row by row in the order of the files. It returns a summary with the number of mismatches in each column (and the difference in the number
+of segments), and a dataframe of every segment that differs with the GDC and Xena values side by side.
+'''
+def compareSegments(sample, data, xena_rows, columns):
+	length = min(len(data), len(xena_rows))
+	gdc = data[columns].iloc[:length].reset_index(drop = True)
+	xena = xena_rows[columns].iloc[:length].reset_index(drop = True)
+	match = pd.DataFrame({column: sameValues(gdc[column], xena[column], column) for column in columns})
+	summary = {"sample": sample}
+	for column in columns:
+		summary[column] = int((~match[column]).sum())
+	summary["segments"] = len(data) - len(xena_rows) # segments only in the GDC file if positive, only in the xena file if negative
+	rows = np.nonzero(~match.all(axis = 1).to_numpy())[0]
+	differing = pd.concat([gdc.iloc[rows].add_prefix("gdc_"), xena.iloc[rows].add_prefix("xena_")], axis = 1)
+	differing.insert(0, "segment", rows)
+	differing.insert(0, "sample", sample)
+	return summary, differing
+
+'''
+alleleCheck checks the two allele specific columns of a GDC seg file, which the xena file does not have: the major and minor copy numbers
+of every segment must add up to its total copy number (value). The segments where they do not are returned.
+'''
+def alleleCheck(sample, data):
+	if not all(column in data.columns for column in allele_columns):
+		return pd.DataFrame()
+	total = data[allele_columns[0]].to_numpy(dtype = float) + data[allele_columns[1]].to_numpy(dtype = float)
+	value = data[keyword[5]].to_numpy(dtype = float)
+	wrong = ~((total == value) | (np.isnan(total) & np.isnan(value)))
+	failed = data[wrong][keyword[2:6] + allele_columns].reset_index(drop = True)
+	failed.insert(0, "sample", sample)
+	return failed
+
+'''
+joinSegments matches the GDC segments of every sample (gdc_segments) with the segments in xena_df by sample, chromosome, start and end,
+with one hash join (pd.merge) instead of relying on the order of the rows. Coordinates are compared as floats, so 100 and 100.0 are the
+same segment. It returns the segments only in the GDC files (missing from Xena), the segments only in the xena file (extra), the segments
+in both where any of the other columns differ, and the keys that appear more than once in either file, which cannot be matched one to one.
+'''
+def joinSegments(gdc_segments, xena_df, columns):
+	value_columns = [column for column in columns if column not in segment_keys]
+	tables = []
+	for df in [gdc_segments, xena_df]:
+		table = df[segment_keys + value_columns].copy()
+		table[keyword[2]] = table[keyword[2]].astype(str)
+		table[keyword[3]] = table[keyword[3]].astype(float)
+		table[keyword[4]] = table[keyword[4]].astype(float)
+		tables.append(table)
+	duplicated = pd.concat([table[table.duplicated(subset = segment_keys, keep = False)] for table in tables], keys = ["gdc", "xena"])
+	joined = tables[0].merge(tables[1], on = segment_keys, how = "outer", suffixes = ("_gdc", "_xena"), indicator = True)
+	missing = joined[joined["_merge"] == "left_only"].drop(columns = ["_merge"] + [column + "_xena" for column in value_columns])
+	extra = joined[joined["_merge"] == "right_only"].drop(columns = ["_merge"] + [column + "_gdc" for column in value_columns])
+	both = joined[joined["_merge"] == "both"].drop(columns = ["_merge"])
+	same = np.ones(len(both), dtype = bool)
+	for column in value_columns:
+		same = same & sameValues(both[column + "_gdc"], both[column + "_xena"], column)
+	return missing, extra, both[~same], duplicated
+
+'''
+printJoin prints the result of joinSegments(): the number of missing, extra and mismatched segments of each sample, followed by the first
+mismatch_rows segments of each kind. The samples with none of them are returned.
+'''
+def printJoin(missing, extra, mismatched, duplicated, sample_list):
+	if len(duplicated) > 0:
+		print("\nsegments that appear more than once in a file:")
+		print(duplicated.head(mismatch_rows).to_string())
+	counts = pd.DataFrame({
+		"missing": missing.groupby("sample").size(),
+		"extra": extra.groupby("sample").size(),
+		"mismatched": mismatched.groupby("sample").size()
+	}).fillna(0).astype(int)
+	if len(counts) > 0:
+		print("\nsegments missing from the xena file, only in the xena file and with a different value, per failed sample:")
+		print(counts.to_string())
+	for name, segments in [["missing from the xena file", missing], ["only in the xena file", extra], ["with a different value", mismatched]]:
+		if len(segments) > 0:
+			print("\nfirst " + str(min(mismatch_rows, len(segments))) + " of " + str(len(segments)) + " segments " + name + ":")
+			print(segments.head(mismatch_rows).to_string(index = False))
+	failed = set(counts.index) | set(duplicated["sample"])
+	return [sample for sample in sample_list if sample not in failed]
+
+'''
+printResults prints the result of one file type after its name: the number of mismatches per column of every failed sample, the first mismatch_rows
+differing segments, the segments whose allele specific copy numbers do not add up, and the number of samples that passed.
+'''
+def printResults(result, sample_list):
+	if len(result["summaries"]) > 0:
+		print("\nmismatches per column of each failed sample (segments: GDC segments - Xena segments):")
+		print(pd.DataFrame(result["summaries"]).to_string(index = False))
+		differing = pd.concat(result["differing"], ignore_index = True)
+		print("\nfirst " + str(min(mismatch_rows, len(differing))) + " of " + str(len(differing)) + " differing segments:")
+		print(differing.head(mismatch_rows).to_string(index = False))
+	if len(result["alleles"]) > 0:
+		alleles = pd.concat(result["alleles"], ignore_index = True)
+		print("\nsegments where " + " + ".join(allele_columns) + " is not " + keyword[5] + " (" + str(len(alleles)) + "):")
+		print(alleles.head(mismatch_rows).to_string(index = False))
+	print("\nsamples passed: " + str(result["passed"]) + "/" + str(len(sample_list)))
+	if result["passed"] == len(sample_list):
 		print("success")
 	else: 
 		print("fail")
 
+'''
+compareSamples compares every downloaded GDC seg file with the rows of its sample in the xena file of its type, found through sample_rows.
+The files of every type are downloaded together in one pass. A sample passes if every segment matches in all compared columns, both have
+the same number of segments and the allele specific copy numbers add up. The results of each type are printed at the end.
+'''
+def compareSamples(uuid_sample, uuid_type, uuid_md5, file_id_list, xena_dfs, sample_lists, sample_rows, type_files):
+	results = {} # file type -> samples passed, mismatches per column, differing segments, segments to join and allele failures
+	for cnv_type in xena_dfs:
+		results[cnv_type] = {"passed": 0, "summaries": [], "differing": [], "segments": [], "alleles": []}
+	if stream_download == True or cache_dir != None:
+		# yields the file id, file name and bytes of each file, from the cache or as it arrives.
+		gdc_files = GDCDownload.streamFiles(file_id_list, cache_dir = cache_dir, md5sums = uuid_md5, cache_size = cache_size)
+	else:
+		gdc_files = GDCDownload.extractedFiles(file_id_list, "gdc_download")
+	for uuid, file, raw_data in gdc_files:
+		if uuid not in uuid_sample: # a file that is not in the manifest
+			print("\nfile not in the manifest, it is not compared: " + str(uuid) + " " + str(file))
+			continue
+		sample = uuid_sample[uuid]
+		cnv_type = uuid_type[uuid]
+		result = results[cnv_type]
+		schema = cnv_file_types[cnv_type]["columns"]
+		data = GDCDownload.readTable(raw_data, skiprows = 1, index_col=0, header=None)
+		data = data.iloc[:, :len(schema)]
+		data.columns = schema
+		alleles = alleleCheck(sample, data)
+		if len(alleles) > 0:
+			result["alleles"].append(alleles)
+		columns = compareColumns(cnv_type, xena_dfs[cnv_type])
+		if join_segments == True:
+			result["segments"].append(data[columns].assign(sample = sample))
+			continue
+		start, stop = sample_rows[cnv_type][sample]
+		summary, sample_differing = compareSegments(sample, data, xena_dfs[cnv_type].iloc[start:stop], columns)
+		if len(sample_differing) == 0 and summary["segments"] == 0 and len(alleles) == 0:
+			result["passed"] += 1
+			print(sample + " (" + cnv_type + ") pass")
+		else:
+			print(sample + " (" + cnv_type + ") fail")
+			if len(sample_differing) > 0 or summary["segments"] != 0: # otherwise only the allele check failed
+				result["summaries"].append(summary)
+				result["differing"].append(sample_differing)
+	for cnv_type, result in results.items():
+		print("\n" + type_files[cnv_type] + " (" + cnv_type + ")")
+		if join_segments == True:
+			columns = compareColumns(cnv_type, xena_dfs[cnv_type])
+			if len(result["segments"]) > 0:
+				gdc_segments = pd.concat(result["segments"], ignore_index = True)
+			else:
+				gdc_segments = pd.DataFrame(columns = segment_keys + [column for column in columns if column not in segment_keys]) # columns already has Chrom, Start and End
+			missing, extra, mismatched, duplicated = joinSegments(gdc_segments, xena_dfs[cnv_type], columns)
+			allele_failed = set()
+			for alleles in result["alleles"]:
+				allele_failed.update(alleles["sample"])
+			passed = printJoin(missing, extra, mismatched, duplicated, sample_lists[cnv_type])
+			result["passed"] = len([sample for sample in passed if sample not in allele_failed])
+		printResults(result, sample_lists[cnv_type])
 
 
-sample = sample(xena_df)
 
-file_names = fileRequest(fileRequestFields, fileRequestSearch, fileRequestKeys, sample, cases_endpt)
+type_files = {} # file type -> xena file of that type
+for xena_file in xena_files:
+	cnv_type = fileType(xena_file)
+	if cnv_type in type_files:
+		print(xena_file + " and " + type_files[cnv_type] + " are both " + cnv_type + " files")
+		sys.exit(0)
+	type_files[cnv_type] = xena_file
+	xena_dfs[cnv_type] = pd.read_csv(xena_file, sep="\t")
+	print(xena_dfs[cnv_type])
+	samples[cnv_type] = sample(xena_dfs[cnv_type])
+	sample_rows[cnv_type] = sampleIndex(xena_dfs[cnv_type])
 
-file_uuids = downloadFiles(downloadFilesFields, file_endpt, file_names)
+manifest = getManifest(samples)
 
-orderedSamples = orderedSamples(cases_endpt, orderedSamplesFields, file_uuids)
+manifest, uuid_sample, uuid_type, uuid_md5 = checkManifest(manifest, samples)
 
-compareSamples(orderedSamples, file_uuids, xena_df, sample)
+file_uuids = downloadFiles(manifest)
 
+compareSamples(uuid_sample, uuid_type, uuid_md5, file_uuids, xena_dfs, samples, sample_rows, type_files)
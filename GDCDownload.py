@@ -0,0 +1,459 @@
+'''
+GDCDownload holds the functions that the validation scripts share for importing files from the GDC /data endpoint.
+Instead of saving the tar bundle to disk and extracting it, the bundle can be read in stream mode. Every file (member)
+in the bundle is read into memory as it arrives and handed to the caller together with its file id, which is the name
+of the directory the file is in. This way nothing is written to disk and only one file is held in memory at a time.
+'''
+
+import io
+import os
+import hashlib
+import re
+import sys
+import time
+import queue
+import tarfile
+import threading
+import requests
+import pandas as pd
+
+
+data_endpt = "https://api.gdc.cancer.gov/data" # data endpoint used to download files by their file ids.
+
+chunk_size = 1024 * 1024 # number of bytes read from the response at a time.
+
+retries = 5 # number of times an interrupted download is resumed before giving up.
+
+timeout = 60 # seconds to wait for the server to connect or send more bytes.
+
+batch_size = 50 # number of file ids downloaded in one request by pipelineFiles().
+
+download_workers = 2 # number of batches pipelineFiles() downloads at the same time.
+
+validate_workers = 2 # number of downloaded batches pipelineFiles() validates at the same time.
+
+queue_size = 4 # number of downloaded batches that can wait for validation before the downloads pause.
+
+cache_size = 50 * 1000 ** 3 # bytes the download cache can hold before the least recently used files are removed.
+
+cache_lock = threading.Lock() # held while a file is stored in or evicted from the download cache, as pipelineFiles() does both from several threads.
+
+# errors after which the download is resumed instead of failing.
+retry_errors = (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.exceptions.Timeout)
+
+
+'''
+postData sends a post request with the list of file ids to the data endpoint. stream is set to True so the body
+of the response is not read yet, it is read by the caller as the bytes arrive. If offset is more than 0, a Range header
+asks the server for the bytes from offset onwards only.
+'''
+def postData(file_ids, endpt = data_endpt, offset = 0):
+    payload = {"ids": file_ids}
+    headers = {"Content-Type": "application/json"}
+    if offset > 0:
+        headers["Range"] = "bytes=" + str(offset) + "-"
+    response = requests.post(endpt, headers = headers, json = payload, stream = True, timeout = timeout)
+    response.raise_for_status()
+    return response
+
+
+'''
+totalSize reads the size of the whole download from the response headers. A partial (206) response has the total
+after the '/' of the Content-Range header, otherwise it is the Content-Length. None is returned if the server did not send it.
+'''
+def totalSize(response):
+    content_range = response.headers.get("Content-Range")
+    if content_range != None and "/" in content_range and not content_range.endswith("*"):
+        return int(content_range.split("/")[-1])
+    if response.headers.get("Content-Length") != None:
+        return int(response.headers["Content-Length"])
+    return None
+
+
+'''
+printProgress prints the number of bytes received so far, the total size if it is known and the download speed in bytes/sec.
+The line is overwritten every time so it works as a progress bar.
+'''
+def printProgress(received, total, speed):
+    line = "\r downloaded " + str(round(received / 1e6, 1)) + " MB"
+    if total != None:
+        line = line + " / " + str(round(total / 1e6, 1)) + " MB"
+    line = line + " (" + str(round(speed / 1e6, 2)) + " MB/s)   "
+    sys.stdout.write(line)
+    sys.stdout.flush()
+
+
+'''
+dataChunks downloads the files of file_ids and yields the response in pieces of chunk_size bytes as they arrive. offset is
+the number of bytes that were already received by an earlier attempt. When the connection drops or the response is cut short,
+the request is sent again with a Range header so the download resumes where it stopped, up to 'retries' times in a row. If
+the server ignores the Range header and sends the whole response again, the download can not be resumed and an IOError is
+raised. The headers of the first response are copied into response_headers when a dictionary is passed, and progress is
+printed about once a second when report is True.
+'''
+def dataChunks(file_ids, endpt = data_endpt, offset = 0, response_headers = None, report = True):
+    received = offset
+    total = None
+    attempt = 0
+    started = time.time()
+    last_report = 0
+    while True:
+        try:
+            resumed = received > 0
+            response = postData(file_ids, endpt, received)
+            if resumed and response.status_code != 206:
+                response.close()
+                raise IOError("The server does not support resuming this download (HTTP Range), received " + str(received) + " bytes")
+            if total == None:
+                total = totalSize(response)
+                if total != None and response.status_code != 206:
+                    total = total + received
+            if response_headers != None and len(response_headers) == 0:
+                response_headers.update(response.headers)
+            for chunk in response.iter_content(chunk_size = chunk_size):
+                received = received + len(chunk)
+                attempt = 0 # bytes are arriving again, so the number of retries in a row is reset.
+                if report == True and time.time() - last_report >= 1:
+                    last_report = time.time()
+                    printProgress(received, total, (received - offset) / max(last_report - started, 1e-9))
+                yield chunk
+            response.close()
+            if total != None and received < total:
+                raise requests.exceptions.ChunkedEncodingError("Response ended after " + str(received) + " of " + str(total) + " bytes")
+            break
+        except retry_errors as error:
+            attempt = attempt + 1
+            if attempt > retries:
+                raise
+            print("\n download interrupted (" + str(error) + "), resuming from byte " + str(received))
+            time.sleep(min(2 ** attempt, 30))
+    if report == True:
+        printProgress(received, total, (received - offset) / max(time.time() - started, 1e-9))
+        print("")
+
+
+'''
+ChunkReader turns the chunks yielded by dataChunks() into a file object with a read() method, so the download can be
+read by tarfile in stream mode without saving it.
+'''
+class ChunkReader(io.RawIOBase):
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self.buffer) == 0:
+            try:
+                self.buffer = next(self.chunks)
+            except StopIteration:
+                return 0
+        size = min(len(b), len(self.buffer))
+        b[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+'''
+downloadFile downloads the files of file_ids to file_name. The bytes are first written to file_name + '.part', and if that file
+already exists from an interrupted run, the download resumes from its size. If the server answers that there is nothing
+after that size (HTTP 416) and the part file is as long as the whole download, the run was interrupted just before the rename
+and the part file is used as it is. If the server can not resume, or the part file does not match the download, the part file
+is started again from the beginning. Once complete, the part file is renamed to file_name.
+'''
+def downloadFile(file_ids, file_name, endpt = data_endpt):
+    part_name = file_name + ".part"
+    offset = 0
+    if os.path.exists(part_name):
+        offset = os.path.getsize(part_name)
+    restart = False
+    try:
+        with open(part_name, "ab") as part:
+            for chunk in dataChunks(file_ids, endpt, offset):
+                part.write(chunk)
+    except requests.exceptions.HTTPError as error:
+        if offset == 0 or error.response is None or error.response.status_code != 416:
+            raise
+        # the Content-Range of a 416 response is 'bytes */total', so totalSize() reads the size of the whole download.
+        if totalSize(error.response) != offset:
+            print("\n part file does not match the download (HTTP 416), downloading again from the beginning")
+            restart = True
+    except IOError as error:
+        if offset == 0 or isinstance(error, requests.exceptions.RequestException):
+            raise
+        print("\n" + str(error) + ", downloading again from the beginning")
+        restart = True
+    if restart == True:
+        os.remove(part_name)
+        with open(part_name, "wb") as part:
+            for chunk in dataChunks(file_ids, endpt):
+                part.write(chunk)
+    os.replace(part_name, file_name)
+    return file_name
+
+
+'''
+streamBundle opens a tar bundle from a file object in stream mode ('r|*'), so members can only be read in the order
+they arrive. The GDC bundle is a directory per file id with one file in it, as well as a MANIFEST.txt at the top
+level which is skipped. For each file, the file id, file name and the bytes of the file are yielded.
+'''
+def streamBundle(fileobj):
+    bundle = tarfile.open(fileobj = fileobj, mode = "r|*")
+    for member in bundle:
+        path_parts = member.name.split("/")
+        if not member.isfile() or len(path_parts) < 2: # directories and the MANIFEST.txt are skipped
+            continue
+        data = bundle.extractfile(member).read()
+        yield path_parts[0], path_parts[-1], data
+    bundle.close()
+
+
+'''
+fileName reads the name of a single downloaded file from the Content-Disposition header of the response.
+'''
+def fileName(headers):
+    disposition = headers.get("Content-Disposition", "")
+    name = re.findall('filename="?([^";]+)"?', disposition)
+    if len(name) > 0:
+        return name[0]
+    return None
+
+
+'''
+bundleFiles downloads the files of file_ids and yields (file_id, file_name, data) for each file, without writing anything to
+disk. report is passed on to dataChunks(). When only one file id is requested the GDC sends the file itself instead of a tar bundle.
+'''
+def bundleFiles(file_ids, endpt = data_endpt, report = True):
+    response_headers = requests.structures.CaseInsensitiveDict()
+    chunks = dataChunks(file_ids, endpt, response_headers = response_headers, report = report)
+    if len(file_ids) == 1:
+        data = b"".join(chunks)
+        yield file_ids[0], fileName(response_headers), data
+    else:
+        for file_id, name, data in streamBundle(io.BufferedReader(ChunkReader(chunks), chunk_size)):
+            yield file_id, name, data
+
+
+'''
+cacheEntry is the directory of a file in the download cache. Files are addressed by both their file id and md5sum, so a file that
+the GDC has replaced (same id, new content) is never read from the cache.
+'''
+def cacheEntry(cache_dir, file_id, md5sum):
+    return os.path.join(cache_dir, file_id + "_" + md5sum)
+
+
+'''
+cacheLookup returns the path of a cached file, or None if it is not in the cache. The modified time of a file that is found is
+set to now, which is how the cache keeps track of the least recently used files.
+'''
+def cacheLookup(cache_dir, file_id, md5sum):
+    if md5sum == None:
+        return None
+    entry = cacheEntry(cache_dir, file_id, md5sum)
+    if not os.path.isdir(entry):
+        return None
+    names = os.listdir(entry)
+    if len(names) != 1:
+        return None
+    path = os.path.join(entry, names[0])
+    try:
+        os.utime(path)
+    except FileNotFoundError: # evicted by another thread in the meantime
+        return None
+    return path
+
+
+'''
+checkMd5 compares the md5sum of the bytes of a downloaded file with the md5sum from the GDC. A file that does not match was cut
+short or corrupted on the way, so an IOError is raised instead of letting the bad bytes be validated. Files without an md5sum are
+not checked.
+'''
+def checkMd5(file_id, md5sum, data):
+    if md5sum != None and hashlib.md5(data).hexdigest() != md5sum:
+        raise IOError("md5sum of " + file_id + " does not match the GDC, the download is corrupt")
+
+
+'''
+cacheStore saves the bytes of a downloaded file, which streamFiles() has already checked with checkMd5(), in the cache. The file is
+written under a temporary name and then renamed, so a half written file is never read. It is done under cache_lock so cacheEvict()
+can not remove the directory in between. Returns True if the file was cached.
+'''
+def cacheStore(cache_dir, file_id, md5sum, file_name, data):
+    if md5sum == None:
+        return False
+    entry = cacheEntry(cache_dir, file_id, md5sum)
+    temporary = os.path.join(cache_dir, file_id + "_" + md5sum + ".part" + str(threading.get_ident()))
+    with cache_lock:
+        os.makedirs(entry, exist_ok = True)
+        with open(temporary, "wb") as file:
+            file.write(data)
+        os.replace(temporary, os.path.join(entry, file_name or file_id))
+    return True
+
+
+'''
+cacheEvict removes the least recently used files from the cache until the total size of the cache is at most size bytes. It holds
+cache_lock, so no file is being stored while directories are removed.
+'''
+def cacheEvict(cache_dir, size):
+    with cache_lock:
+        entries = [] # [last used, bytes, directory, path] of every cached file
+        for entry in os.listdir(cache_dir):
+            directory = os.path.join(cache_dir, entry)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append([stat.st_mtime, stat.st_size, directory, path])
+        total = sum(entry[1] for entry in entries)
+        for last_used, file_size, directory, path in sorted(entries):
+            if total <= size:
+                break
+            try:
+                os.remove(path)
+                os.rmdir(directory)
+            except (FileNotFoundError, OSError):
+                pass
+            total = total - file_size
+
+
+'''
+streamFiles yields (file_id, file_name, data) for every file in file_ids. If cache_dir is given, the cache is consulted first: files
+found in it (by file id and the md5sum in the md5sums dictionary) are read from disk, and only the missing files are downloaded with
+bundleFiles(). Every downloaded file with an md5sum is checked with checkMd5(), which raises an IOError for a corrupt download. Downloaded
+files are added to the cache, and the cache is then trimmed to cache_size bytes. Without cache_dir nothing is written to disk.
+'''
+def streamFiles(file_ids, endpt = data_endpt, report = True, cache_dir = None, md5sums = {}, cache_size = cache_size):
+    missing = file_ids # files that have to be downloaded
+    if cache_dir != None:
+        os.makedirs(cache_dir, exist_ok = True)
+        missing = []
+        for file_id in file_ids:
+            path = cacheLookup(cache_dir, file_id, md5sums.get(file_id))
+            if path == None:
+                missing.append(file_id)
+                continue
+            try:
+                with open(path, "rb") as file:
+                    data = file.read()
+            except FileNotFoundError: # evicted by another thread since the lookup
+                missing.append(file_id)
+                continue
+            yield file_id, os.path.basename(path), data
+        if report == True:
+            print("\n " + str(len(file_ids) - len(missing)) + " of " + str(len(file_ids)) + " files found in the cache")
+    if len(missing) > 0:
+        for file_id, name, data in bundleFiles(missing, endpt, report):
+            checkMd5(file_id, md5sums.get(file_id), data)
+            if cache_dir != None:
+                cacheStore(cache_dir, file_id, md5sums.get(file_id), name, data)
+            yield file_id, name, data
+        if cache_dir != None:
+            cacheEvict(cache_dir, cache_size)
+
+
+'''
+extractedFiles yields (file_id, file_name, data) in the same way as streamFiles, but for a bundle that has already been
+extracted to directory. It is used when the bundle is saved to disk instead of streamed.
+'''
+def extractedFiles(file_ids, directory):
+    for file_id in file_ids:
+        name = os.listdir(os.path.join(directory, file_id))[0]
+        with open(os.path.join(directory, file_id, name), "rb") as file:
+            data = file.read()
+        yield file_id, name, data
+
+
+'''
+readTable parses the bytes of a downloaded tsv file into a dataframe. Any arguments for pd.read_csv can be passed in kwargs.
+'''
+def readTable(data, **kwargs):
+    return pd.read_csv(io.BytesIO(data), sep = '\t', **kwargs)
+
+
+'''
+batches splits a list of file ids into lists of at most size file ids each.
+'''
+def batches(file_ids, size):
+    batch_list = []
+    for i in range(0, len(file_ids), size):
+        batch_list.append(file_ids[i:i + size])
+    return batch_list
+
+
+'''
+downloadBatches is run by every download thread of pipelineFiles(). It takes the next batch of file ids from pending, downloads
+all of its files into memory and puts the list of (file_id, file_name, data) on the downloaded queue. When the queue is full, put()
+waits until a validate thread takes a batch, so downloads never get more than queue_size batches ahead of validation. Errors are
+saved to errors instead of stopping the thread.
+'''
+def downloadBatches(pending, downloaded, endpt, errors, stream_options):
+    while True:
+        try:
+            batch_number, batch = pending.get_nowait()
+        except queue.Empty:
+            return
+        try:
+            files = list(streamFiles(batch, endpt, report = False, **stream_options))
+            print("\n batch " + str(batch_number + 1) + " downloaded (" + str(len(files)) + " files)")
+            downloaded.put(files)
+        except Exception as error:
+            errors.append(error)
+
+
+'''
+validateBatches is run by every validate thread of pipelineFiles(). It takes downloaded batches off the queue and passes them to validate
+until it receives None, which means all downloads are done. The value validate returns is appended to results.
+'''
+def validateBatches(downloaded, validate, results, errors):
+    while True:
+        files = downloaded.get()
+        if files == None:
+            return
+        try:
+            results.append(validate(files))
+        except Exception as error:
+            errors.append(error)
+
+
+'''
+pipelineFiles downloads file_ids in batches of batch_size and validates each batch as soon as it has been downloaded, so the network and
+the CPU are busy at the same time. download_workers batches are downloaded at once, and validate_workers threads call validate with the
+list of (file_id, file_name, data) of each batch. A bounded queue of queue_size batches sits between the two stages. Any other
+keyword arguments (such as cache_dir and md5sums) are passed on to streamFiles(). The list of values
+returned by validate is returned, in the order the batches finished. If any download or validation failed, the first error is raised once
+every thread has stopped.
+'''
+def pipelineFiles(file_ids, validate, endpt = data_endpt, batch_size = batch_size, download_workers = download_workers,
+        validate_workers = validate_workers, queue_size = queue_size, **stream_options):
+    pending = queue.Queue() # batches that have not been downloaded yet
+    batch_list = batches(file_ids, batch_size)
+    for batch_number in range(len(batch_list)):
+        pending.put((batch_number, batch_list[batch_number]))
+    print("\n downloading " + str(len(file_ids)) + " files in " + str(len(batch_list)) + " batches")
+    downloaded = queue.Queue(maxsize = queue_size) # batches that have been downloaded and wait for validation
+    results = []
+    errors = []
+    download_threads = []
+    for i in range(download_workers):
+        download_threads.append(threading.Thread(target = downloadBatches, args = (pending, downloaded, endpt, errors, stream_options)))
+    validate_threads = []
+    for i in range(validate_workers):
+        validate_threads.append(threading.Thread(target = validateBatches, args = (downloaded, validate, results, errors)))
+    for thread in download_threads + validate_threads:
+        thread.start()
+    for thread in download_threads:
+        thread.join()
+    for thread in validate_threads: # one None per validate thread tells it that there are no more batches.
+        downloaded.put(None)
+    for thread in validate_threads:
+        thread.join()
+    if len(errors) > 0:
+        raise errors[0]
+    return results
@@ -0,0 +1,151 @@
+'''
+GDCQuery holds the functions that the validation scripts share for searching the GDC API. Instead of sending one request
+with a fixed "size" and hoping that every hit fits in it, iterHits() and fetchHits() read the pagination of the first page
+and request the rest of the pages at the same time. A filter with a very long list of values (thousands of submitter ids)
+is split by chunkFilters() into several smaller filters, which are requested side by side and merged. resolveManifest() uses
+them to go from a list of sample submitter ids straight to the files of those samples with a single /files query, returning the
+sample, file id, file name, md5sum and file size of each file.
+'''
+
+import itertools
+import requests
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+
+cases_endpt = "https://api.gdc.cancer.gov/cases" # cases endpoint
+
+files_endpt = "https://api.gdc.cancer.gov/files" # files endpoint
+
+page_size = 1000 # number of hits requested per page
+
+query_workers = 4 # number of pages requested at the same time
+
+filter_chunk = 500 # largest number of values sent in the 'in' filter of a single request by chunkFilters()
+
+# id field each endpoint's pages are sorted by, so pages requested at the same time by offset never overlap or skip a hit.
+sort_fields = {cases_endpt: "case_id", files_endpt: "file_id"}
+
+# columns of the dataframe returned by resolveManifest()
+manifest_columns = ["sample", "file_id", "file_name", "md5sum", "file_size"]
+
+# fields requested by resolveManifest()
+manifest_fields = ["file_id", "file_name", "md5sum", "file_size", "cases.samples.submitter_id"]
+
+
+'''
+postPage sends a post request for one page of hits to endpt. 'start' is the index of the first hit of the page, and 'sort' is
+the field the hits are sorted by (ascending), None leaves the order to the GDC. The 'data' dictionary of the response is
+returned, which has the list of 'hits' as well as the 'pagination'.
+'''
+def postPage(endpt, filters, fields, start, size = page_size, sort = None):
+    params = {
+        "filters": filters,
+        "fields": ",".join(fields),
+        "format": "json",
+        "size": str(size),
+        "from": str(start)
+        }
+    if sort != None:
+        params["sort"] = sort + ":asc"
+    response = requests.post(endpt, headers = {"Content-Type": "application/json"}, json = params)
+    response.raise_for_status()
+    return response.json().get("data")
+
+
+'''
+iterHits yields every hit of a query, however many pages there are, as soon as its page arrives. filters is one filter or
+a list of filters (such as the chunks made by chunkFilters()). The first page of every filter is requested first, since its
+pagination tells us the total number of hits. All remaining pages are then requested, and up to 'workers' requests are sent
+at once throughout. Pages are fetched by offset, so every page is sorted by the id field of the endpoint (sort_fields) to
+keep them from overlapping. The hits come in the order of the filters and their pages, and each hit is only yielded once,
+by its id, even if it matches more than one of the filters. Once every page has arrived, the number of different hits of each
+filter is checked against its pagination total and a warning is printed if they are not the same.
+'''
+def iterHits(endpt, filters, fields, size = page_size, workers = query_workers):
+    if type(filters) != list:
+        filters = [filters]
+    sort = sort_fields.get(endpt)
+    seen = set() # ids of the hits already yielded
+    filter_ids = [set() for query in filters] # ids of the hits received for each filter
+    received = [0] * len(filters) # number of different hits received for each filter
+    totals = [] # pagination total of each filter
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        first_pages = list(pool.map(lambda query: postPage(endpt, query, fields, 0, size, sort), filters))
+        remaining = [] # (filter number, first hit) of every remaining page
+        for number in range(len(filters)):
+            totals.append(first_pages[number].get("pagination").get("total"))
+            for start in range(size, totals[number], size):
+                remaining.append((number, start))
+        pages = pool.map(lambda page: (page[0], postPage(endpt, filters[page[0]], fields, page[1], size, sort)), remaining)
+        for number, page in itertools.chain(enumerate(first_pages), pages): # pool.map hands back each page once it and the pages before it are done
+            for hit in page.get("hits"):
+                hit_id = hit.get("id")
+                if hit_id != None:
+                    if hit_id in filter_ids[number]: # the same hit on two pages of one filter
+                        continue
+                    filter_ids[number].add(hit_id)
+                received[number] = received[number] + 1
+                if hit_id != None:
+                    if hit_id in seen: # already yielded for another filter
+                        continue
+                    seen.add(hit_id)
+                yield hit
+    for number in range(len(filters)):
+        if received[number] != totals[number]:
+            print("\n warning: " + str(received[number]) + " of " + str(totals[number]) + " hits were received from " + endpt + ", some may be missing")
+
+
+'''
+fetchHits returns every hit of a query as one list, see iterHits().
+'''
+def fetchHits(endpt, filters, fields, size = page_size, workers = query_workers):
+    return list(iterHits(endpt, filters, fields, size, workers))
+
+
+'''
+inFilter builds a filter where field must be one of values. file_filters is a dictionary of any other fields and values that
+the hits must match, such as the data format or workflow type. All of the conditions are joined together with 'and'.
+'''
+def inFilter(field, values, file_filters = {}):
+    content = [{"op": "in", "content": {"field": field, "value": values}}]
+    for key, value in file_filters.items():
+        if type(value) != list:
+            value = [value]
+        content.append({"op": "in", "content": {"field": key, "value": value}})
+    return {"op": "and", "content": content}
+
+
+'''
+chunkFilters splits a long list of values into chunks of at most chunk_size and builds the same filter as inFilter() for
+each chunk, so no request carries a huge list of values. The list of filters can be passed straight to fetchHits().
+'''
+def chunkFilters(field, values, file_filters = {}, chunk_size = filter_chunk):
+    values = list(values)
+    chunks = []
+    for start in range(0, max(len(values), 1), chunk_size):
+        chunks.append(inFilter(field, values[start:start + chunk_size], file_filters))
+    return chunks
+
+
+'''
+resolveManifest finds the files of the samples in sample_list with one paginated query to the files endpoint, split into
+chunks of filter_chunk samples when the list is long. file_filters narrows the query to one kind of file (for example
+{"analysis.workflow_type": "STAR - Counts"}), and if search is given only files with search in their file name are kept.
+The result is a dataframe with the columns in manifest_columns, one row per sample and file. A file belonging to more than
+one of the samples appears once per sample.
+'''
+def resolveManifest(sample_list, file_filters, search = None, size = page_size, workers = query_workers):
+    filters = chunkFilters("cases.samples.submitter_id", sample_list, file_filters)
+    hits = fetchHits(files_endpt, filters, manifest_fields, size, workers)
+    wanted = set(sample_list)
+    rows = []
+    for hit in hits: # each hit is a single file
+        if search != None and hit["file_name"].find(search) == -1:
+            continue
+        for case in hit.get("cases", []):
+            for sample in case.get("samples", []):
+                if sample["submitter_id"] in wanted:
+                    rows.append([sample["submitter_id"], hit["file_id"], hit["file_name"], hit.get("md5sum"), hit.get("file_size")])
+    manifest = pd.DataFrame(rows, columns = manifest_columns)
+    return manifest.drop_duplicates(ignore_index = True)
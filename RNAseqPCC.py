@@ -1,8 +1,9 @@
+import os
 import sys
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import itertools
+import XenaMatrix
 
 #############################################ARGUMENTS###############################################
 '''
@@ -24,12 +25,36 @@ if len(sys.argv) != 5:
 
 ############################################GLOBAL###################################################
 file_name = [file_1, file_2, file_3, file_4] 
-files = [None] * len(file_name)
+files = [None] * len(file_name) # columns of the first sample of each file, used by PCCcol()
+first_rows = [None] * len(file_name) # first gene (row) of each file, used by PCCrow()
 special_case = None
 combinations= []
 
 ############################################constants################################################
 keywords = ['counts.tsv', 'tpm.tsv', 'fpkm.tsv', 'fpkm-uq.tsv']
+matrix_cache_dir = None # directory where a binary copy of each matrix is kept for fast reloads, None turns it off.
+matrix_dtype = None # set to np.float32 to read the matrices with half the memory, None keeps float64.
+parse_workers = 4 # number of matrices parsed at the same time by separate processes, 1 parses them one after another.
+all_samples = True # when True every sample and every gene of every pair is correlated, when False only the first sample and gene.
+correlation_file = "RNAseqPCC_correlations.tsv" # where the table of every correlation is written when all_samples is True.
+streaming = False # when True the matrices are read a chunk of rows at a time instead of whole, for matrices larger than memory.
+stream_chunk_rows = 2000 # number of rows (genes) of each matrix read at a time when streaming.
+correlation_block_size = 512 # number of samples (or genes) that are correlated together in one NumPy operation.
+correlation_columns = ["axis", "name", "type_1", "type_2", "pearson", "spearman"] # columns of the correlation table
+outlier_check = True # when True the samples whose correlations are far below the rest of the cohort are reported, see outlierTable().
+outlier_threshold = 3.5 # a sample is flagged when its robust z-score for a pair is below minus this value.
+outlier_min_scale = 1e-6 # smallest spread used for the robust z-score, so a cohort of identical correlations does not flag rounding noise.
+outlier_file = "RNAseqPCC_outliers.tsv" # where the robust z-score of every sample and pair is written.
+outlier_columns = ["sample", "pairs_flagged", "lowest_z", "lowest_pair", "lowest_pearson", "lowest_spearman"] # columns of the outlier report
+identity_check = True # when True TPM, FPKM and FPKM-UQ are checked to be the same values scaled per sample, see identityTable().
+identity_rtol = 1e-3 # relative tolerance of the identity check, the GDC values are rounded to 4 decimals before the log2(x+1).
+identity_atol = 1e-3 # absolute tolerance of the identity check, in TPM.
+identity_columns = ["sample", "type", "genes_failed", "max_abs_error", "max_rel_error"] # columns of the identity table
+plot_dir = None # directory where plots are saved with the non-interactive Agg backend, None shows them in a window instead.
+plot_format = "png" # file format of saved plots, "png" or "svg".
+plot_kind = "scatter" # "scatter" plots every point, "hexbin" or "hist2d" plot the density of the points, which is faster when there are many.
+plot_points = None # largest number of points plotted, a random sample of the points is plotted if there are more. None plots them all.
+plot_gridsize = 100 # number of hexagons (or bins) across the x axis of a density plot.
 
 
 def specialCase(files):
@@ -55,10 +80,95 @@ def getSamples(xena_file):
     return(sampleList)
 
 def formatDf(file):
-	file_df = pd.read_csv(file, sep= '\t', index_col = 0)
+	file_df = XenaMatrix.loadMatrix(file, matrix_cache_dir) # parsed, or opened from its binary copy in matrix_cache_dir
 
 	return file_df
 
+'''
+formatAll reads every matrix in names. Without matrix_cache_dir the files are parsed at the same time by parse_workers processes, which
+hand the values back through shared memory. With it the binary copies are memory mapped, which is already fast.
+'''
+def formatAll(names):
+	if matrix_cache_dir != None or parse_workers < 2:
+		return [formatDf(name) for name in names]
+	return XenaMatrix.loadMatrices(names, min(parse_workers, len(names)), matrix_dtype)
+
+'''
+checkHeaders checks from the header line of each file that every matrix has the same samples in the same order as the first one, before
+any of them is parsed. checkGenes does the same for the genes once the matrices are loaded. Matrices are matched by sample and gene name,
+so a difference is printed and not an error, except when streaming, where the genes must be in the same order.
+'''
+def checkHeaders(names):
+	first = getSamples(names[0])
+	for name in names[1:]:
+		other = getSamples(name)
+		if other == first:
+			continue
+		if set(other) == set(first):
+			print("\n" + name + " has the same samples as " + names[0] + " in a different order")
+		else:
+			print("\n" + name + " has " + str(len(set(other) - set(first))) + " samples not in " + names[0] + " and is missing " + str(len(set(first) - set(other))))
+
+def checkGenes(dfs, names):
+	for i in range(1, len(dfs)):
+		if not dfs[i].index.equals(dfs[0].index):
+			print("\n" + names[i] + " does not have the same genes in the same order as " + names[0])
+
+'''
+formatColumns reads only the columns of sample_list from file and formatRow reads only its first row. The matrices can be much larger
+than memory, and the correlations only need one sample and one gene of each, so neither of them loads the whole matrix.
+'''
+def formatColumns(file, sample_list):
+	file_df = XenaMatrix.loadColumns(file, sample_list, matrix_cache_dir, matrix_dtype)
+
+	return file_df
+
+def formatRow(file):
+	if matrix_cache_dir != None:
+		return XenaMatrix.loadMatrix(file, matrix_cache_dir).iloc[:1]
+	file_df = next(XenaMatrix.iterRows(file, rows_per_chunk = 1, dtype = matrix_dtype))
+
+	return file_df
+
+'''
+getPyplot imports matplotlib the first time a plot is made, so runs that only print correlations do not pay for the import. When plot_dir
+is set the Agg backend is selected first, which renders to files and does not need a display.
+'''
+def getPyplot():
+	import matplotlib
+	if plot_dir != None:
+		matplotlib.use("Agg")
+	import matplotlib.pyplot as plt
+	return plt
+
+'''
+plotPair plots the values of corr_1 against corr_2 (matched by gene or sample name) as a scatter plot or, for a dense cloud of points,
+a hexbin or 2-D histogram of their density (plot_kind). If there are more than plot_points points a random sample of them is plotted.
+The plot is shown in a window, or saved as plot_dir/<name>_<type 1>_vs_<type 2>.<plot_format> if plot_dir is set.
+'''
+def plotPair(corr_1, corr_2, file_1_name, file_2_name, fontsize, name):
+	plt = getPyplot()
+	points = pd.concat([corr_1, corr_2], axis = 1).dropna().to_numpy()
+	if plot_points != None and len(points) > plot_points:
+		keep = np.random.default_rng(0).choice(len(points), plot_points, replace = False)
+		points = points[np.sort(keep)]
+	fig , plot = plt.subplots()
+	if plot_kind == "hexbin":
+		plot.hexbin(points[:, 0], points[:, 1], gridsize = plot_gridsize, bins = "log", mincnt = 1)
+	elif plot_kind == "hist2d":
+		plot.hist2d(points[:, 0], points[:, 1], bins = plot_gridsize, cmin = 1)
+	else:
+		plot.scatter(points[:, 0], points[:, 1], s = 5)
+	plot.set_xlabel(file_1_name, fontsize = fontsize)
+	plot.set_ylabel(file_2_name, fontsize = fontsize)
+	if plot_dir == None:
+		plt.show()
+		return
+	os.makedirs(plot_dir, exist_ok = True)
+	plot_name = name + "_" + str(file_1_name).replace(".tsv", "") + "_vs_" + str(file_2_name).replace(".tsv", "")
+	fig.savefig(os.path.join(plot_dir, plot_name + "." + plot_format))
+	plt.close(fig)
+
 
 def PCCcol(df_1, df_2, sample_list, file_1, file_2):
 	corr_1 = np.exp2(df_1[sample_list[0]]) - 1
@@ -81,11 +191,7 @@ def PCCcol(df_1, df_2, sample_list, file_1, file_2):
 	print(corr_value_non_convert)
 
 
-	fig , plot = plt.subplots()
-	plot.scatter(corr_1, corr_2, s = 5)
-	plt.xlabel(file_1_name, fontsize = 10)
-	plt.ylabel(file_2_name, fontsize = 10)
-	plt.show()
+	plotPair(corr_1, corr_2, file_1_name, file_2_name, 10, "sample_" + str(sample_list[0]))
 
 def PCCrow(df_1, df_2, file_1, file_2):
 	corr_1 = np.exp2(df_1.iloc[0]) - 1
@@ -103,11 +209,333 @@ def PCCrow(df_1, df_2, file_1, file_2):
 	print(file_2_name)
 	print(corr_value)
 
-	fig , plot = plt.subplots()
-	plot.scatter(corr_1, corr_2, s = 5)
-	plt.xlabel(file_1_name, fontsize = 20)
-	plt.ylabel(file_2_name, fontsize = 20)
-	plt.show()
+	plotPair(corr_1, corr_2, file_1_name, file_2_name, 20, "gene_" + str(df_1.index[0]))
+
+'''
+typeName is the keyword (data type) that the file name ends with.
+'''
+def typeName(file):
+	file_type = None
+	for key in keywords:
+		if file.endswith(key):
+			file_type = key
+	return file_type
+
+'''
+pearsonColumns correlates every column of x with the same column of y, both 2-D arrays of the same shape. Rows where either side is
+NaN are left out of that column. The means, co-moments and variances of all columns are computed at once with NumPy reductions, so a
+block of columns costs about as much as one pandas .corr call.
+'''
+def pearsonColumns(x, y):
+	missing = np.isnan(x) | np.isnan(y)
+	if missing.any():
+		x = np.where(missing, np.nan, x)
+		y = np.where(missing, np.nan, y)
+	x = x - np.nanmean(x, axis = 0)
+	y = y - np.nanmean(y, axis = 0)
+	x[missing] = 0
+	y[missing] = 0
+	with np.errstate(invalid = "ignore", divide = "ignore"): # a column with no variance has no correlation (NaN)
+		return (x * y).sum(axis = 0) / np.sqrt((x * x).sum(axis = 0) * (y * y).sum(axis = 0))
+
+'''
+rankColumns ranks the values of every column of x, with ties given their average rank and NaN left as NaN (the same ranks as pandas
+.rank()). All columns are sorted with one argsort, and the first and last position of each run of tied values are found with running
+maximums and minimums, so there is no loop over columns.
+'''
+def rankColumns(x):
+	rows = np.ascontiguousarray(np.asarray(x, dtype = float).T) # one row per column of x, so every sort runs over contiguous memory
+	order = np.argsort(rows, axis = 1)
+	ordered = np.take_along_axis(rows, order, axis = 1)
+	position = np.arange(rows.shape[1])
+	first = np.ones(rows.shape, dtype = bool) # first position of each run of tied values
+	first[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+	last = np.ones(rows.shape, dtype = bool) # last position of each run of tied values
+	last[:, :-1] = first[:, 1:]
+	start = np.maximum.accumulate(np.where(first, position, 0), axis = 1)
+	end = np.minimum.accumulate(np.where(last, position, rows.shape[1])[:, ::-1], axis = 1)[:, ::-1]
+	ranks = np.empty(rows.shape)
+	np.put_along_axis(ranks, order, (start + end) / 2 + 1, axis = 1)
+	ranks[np.isnan(rows)] = np.nan
+	return ranks.T
+
+'''
+spearmanColumns is the Spearman correlation of every column of x with the same column of y, which is the Pearson correlation of their
+ranks. Rows where either side is NaN are left out before ranking, the same as pandas .corr(method = "spearman").
+'''
+def spearmanColumns(x, y):
+	missing = np.isnan(x) | np.isnan(y)
+	if missing.any():
+		x = np.where(missing, np.nan, x)
+		y = np.where(missing, np.nan, y)
+	return pearsonColumns(rankColumns(x), rankColumns(y))
+
+'''
+correlateColumns correlates every column of values_1 with the same column of values_2, correlation_block_size columns at a time so the
+temporary arrays stay small. Pearson is computed on the values converted back from log2(x+1), like PCCcol(), and Spearman on the values
+as they are (ranks do not change with the conversion). The two arrays of correlations are returned.
+'''
+def correlateColumns(values_1, values_2):
+	pearson = []
+	spearman = []
+	for start in range(0, values_1.shape[1], correlation_block_size):
+		block_1 = np.asarray(values_1[:, start:start + correlation_block_size], dtype = float)
+		block_2 = np.asarray(values_2[:, start:start + correlation_block_size], dtype = float)
+		pearson.append(pearsonColumns(np.exp2(block_1) - 1, np.exp2(block_2) - 1))
+		spearman.append(spearmanColumns(block_1, block_2))
+	return np.concatenate(pearson), np.concatenate(spearman)
+
+'''
+correlationTable correlates every sample (column) and every gene (row) of every pair of matrices and returns a dataframe with one row per
+pair and sample or gene. Only the genes and samples that are in both matrices of a pair are correlated, matched by name.
+'''
+def correlationTable(dfs, names, pairs):
+	tables = []
+	for pair in pairs:
+		df_1 = dfs[pair[0]]
+		df_2 = dfs[pair[1]]
+		genes = df_1.index.intersection(df_2.index, sort = False)
+		sample_list = df_1.columns.intersection(df_2.columns, sort = False)
+		values_1 = df_1.reindex(index = genes, columns = sample_list).to_numpy()
+		values_2 = df_2.reindex(index = genes, columns = sample_list).to_numpy()
+		for axis, labels, x, y in [["sample", sample_list, values_1, values_2], ["gene", genes, values_1.T, values_2.T]]:
+			pearson, spearman = correlateColumns(x, y)
+			tables.append(pairTable(axis, labels, names, pair, pearson, spearman))
+	return pd.concat(tables, ignore_index = True)
+
+'''
+pairTable is the part of the correlation table for one pair of matrices and one axis ("sample" or "gene").
+'''
+def pairTable(axis, labels, names, pair, pearson, spearman):
+	return pd.DataFrame({
+		correlation_columns[0]: axis,
+		correlation_columns[1]: np.asarray(labels),
+		correlation_columns[2]: typeName(names[pair[0]]),
+		correlation_columns[3]: typeName(names[pair[1]]),
+		correlation_columns[4]: pearson,
+		correlation_columns[5]: spearman
+	})
+
+'''
+newMoments starts the running sums of size columns for addChunk(): the number of rows seen, the mean of x and of y, the sum of squared
+differences from the mean of x and of y, and the sum of the products of both differences (the co-moment).
+'''
+def newMoments(size):
+	moments = {}
+	for key in ["n", "mean_x", "mean_y", "m2_x", "m2_y", "c_xy"]:
+		moments[key] = np.zeros(size)
+	return moments
+
+'''
+addChunk adds a chunk of rows of x and y (2-D arrays, one column per sample) to moments. The moments of the chunk are computed with NumPy
+and merged into the running ones with the pairwise (Chan) form of Welford's update, which does not lose precision the way running sums of
+squares do. Rows where either side is NaN are left out of that column.
+'''
+def addChunk(moments, x, y):
+	missing = np.isnan(x) | np.isnan(y)
+	x = np.where(missing, 0, x)
+	y = np.where(missing, 0, y)
+	n_b = (~missing).sum(axis = 0)
+	with np.errstate(invalid = "ignore", divide = "ignore"):
+		mean_x_b = np.where(n_b > 0, x.sum(axis = 0) / n_b, 0)
+		mean_y_b = np.where(n_b > 0, y.sum(axis = 0) / n_b, 0)
+		x = np.where(missing, 0, x - mean_x_b)
+		y = np.where(missing, 0, y - mean_y_b)
+		n_a = moments["n"]
+		n = n_a + n_b
+		weight = np.where(n > 0, n_a * n_b / n, 0)
+		delta_x = mean_x_b - moments["mean_x"]
+		delta_y = mean_y_b - moments["mean_y"]
+		moments["m2_x"] = moments["m2_x"] + (x * x).sum(axis = 0) + delta_x * delta_x * weight
+		moments["m2_y"] = moments["m2_y"] + (y * y).sum(axis = 0) + delta_y * delta_y * weight
+		moments["c_xy"] = moments["c_xy"] + (x * y).sum(axis = 0) + delta_x * delta_y * weight
+		moments["mean_x"] = moments["mean_x"] + np.where(n > 0, delta_x * n_b / n, 0)
+		moments["mean_y"] = moments["mean_y"] + np.where(n > 0, delta_y * n_b / n, 0)
+	moments["n"] = n
+
+'''
+pearsonMoments is the Pearson correlation of every column from its running moments.
+'''
+def pearsonMoments(moments):
+	with np.errstate(invalid = "ignore", divide = "ignore"):
+		return moments["c_xy"] / np.sqrt(moments["m2_x"] * moments["m2_y"])
+
+'''
+streamChunks reads the matrices in names a chunk of stream_chunk_rows rows at a time, with only the columns of sample_list, and yields
+the chunks of all of them together. The rows are only aligned if every matrix has its genes in the same order, so this is checked for
+every chunk and a GeneOrderError is raised if they are not.
+'''
+class GeneOrderError(Exception):
+	pass
+
+def streamChunks(names, sample_list):
+	readers = [XenaMatrix.iterRows(name, sample_list, stream_chunk_rows, matrix_dtype) for name in names]
+	for chunks in itertools.zip_longest(*readers):
+		for i in range(1, len(chunks)):
+			if chunks[i] is None or chunks[0] is None or not chunks[i].index.equals(chunks[0].index):
+				raise GeneOrderError(names[i] + " does not have the same genes in the same order as " + names[0])
+		yield chunks
+
+'''
+streamingTable builds the same table as correlationTable() while only holding one chunk of rows of each matrix in memory. Every gene is a
+whole row, so the gene correlations (Pearson and Spearman) are computed chunk by chunk. Each sample is a column spread over every chunk, so
+its Pearson correlation comes from running moments kept for every sample of every pair, in a single pass over the files. Spearman needs the
+ranks of the whole column and is not computed for samples (NaN) when streaming.
+'''
+def streamingTable(names, pairs):
+	sample_list = getSamples(names[0])
+	for name in names[1:]:
+		others = set(getSamples(name))
+		sample_list = [sample for sample in sample_list if sample in others] # samples in every matrix, in the order of the first
+	moments = [newMoments(len(sample_list)) for pair in pairs]
+	gene_tables = []
+	for chunks in streamChunks(names, sample_list):
+		values = [np.asarray(chunk.to_numpy(), dtype = float) for chunk in chunks]
+		for i in range(len(pairs)):
+			x = values[pairs[i][0]]
+			y = values[pairs[i][1]]
+			addChunk(moments[i], np.exp2(x) - 1, np.exp2(y) - 1)
+			pearson, spearman = correlateColumns(x.T, y.T)
+			gene_tables.append(pairTable("gene", chunks[0].index, names, pairs[i], pearson, spearman))
+	tables = []
+	for i in range(len(pairs)):
+		tables.append(pairTable("sample", sample_list, names, pairs[i], pearsonMoments(moments[i]), np.nan))
+	return pd.concat(tables + gene_tables, ignore_index = True)
+
+'''
+toTPM undoes the log2(x+1) of every column of values and scales each column to sum to one million. For FPKM this is the definition of TPM,
+TPM = FPKM / sum(FPKM) * 1e6. FPKM-UQ is FPKM multiplied by one factor per sample (the total read count over the upper quartile count), so
+it gives the same TPM as well.
+'''
+def toTPM(values):
+	values = np.exp2(np.asarray(values, dtype = float)) - 1
+	with np.errstate(invalid = "ignore", divide = "ignore"):
+		return values / np.nansum(values, axis = 0) * 1e6
+
+'''
+identityTable checks that the TPM matrix has exactly the values that the FPKM and FPKM-UQ matrices imply, for every sample at once (in
+blocks of correlation_block_size samples). A gene fails if the TPM value and the TPM computed from the other matrix are not equal within
+identity_rtol and identity_atol, or if it is missing from one side. The table has one row per sample and type, with the number of genes
+that failed and the largest absolute and relative error. The relative error is only taken over genes with an expected TPM above
+identity_atol, since a gene expected at 0 with a rounding-level value would be infinitely wrong. Unlike a correlation, this catches a
+matrix that is off by a scale factor.
+'''
+def identityTable(dfs, names):
+	types = {}
+	for i in range(len(names)):
+		types[typeName(names[i])] = i
+	if keywords[1] not in types:
+		return pd.DataFrame(columns = identity_columns)
+	tpm_df = dfs[types[keywords[1]]]
+	tables = []
+	for key in keywords[2:]:
+		if key not in types:
+			continue
+		other_df = dfs[types[key]]
+		sample_list = tpm_df.columns.intersection(other_df.columns, sort = False)
+		for start in range(0, len(sample_list), correlation_block_size):
+			block = sample_list[start:start + correlation_block_size]
+			# the sums are taken over all genes of the other matrix, before it is matched to the genes of the TPM matrix.
+			expected = pd.DataFrame(toTPM(other_df[block].to_numpy()), index = other_df.index).reindex(tpm_df.index).to_numpy()
+			actual = np.exp2(np.asarray(tpm_df[block].to_numpy(), dtype = float)) - 1
+			close = np.isclose(actual, expected, rtol = identity_rtol, atol = identity_atol, equal_nan = True)
+			error = np.abs(actual - expected)
+			with np.errstate(invalid = "ignore", divide = "ignore"):
+				relative = np.where(expected > identity_atol, error / expected, 0)
+			relative = np.where(np.isnan(error), np.inf, relative) # a gene missing from one side
+			tables.append(pd.DataFrame({
+				identity_columns[0]: np.asarray(block),
+				identity_columns[1]: key,
+				identity_columns[2]: (~close).sum(axis = 0),
+				identity_columns[3]: np.nanmax(np.where(np.isnan(error), np.inf, error), axis = 0),
+				identity_columns[4]: relative.max(axis = 0)
+			}))
+	if len(tables) == 0:
+		return pd.DataFrame(columns = identity_columns)
+	return pd.concat(tables, ignore_index = True)
+
+'''
+printIdentities prints how many samples passed the identity check for each type and every sample that failed.
+'''
+def printIdentities(table):
+	if len(table) == 0:
+		print("\nidentity check skipped, it needs the tpm matrix and the fpkm or fpkm-uq matrix")
+		return
+	for key, rows in table.groupby(identity_columns[1], sort = False):
+		failed = rows[rows[identity_columns[2]] > 0]
+		print("\n" + keywords[1] + " vs " + key + " identity: " + str(len(rows) - len(failed)) + "/" + str(len(rows)) + " samples passed")
+		if len(failed) > 0:
+			print(failed.to_string(index = False))
+
+'''
+printSummary prints the lowest and median correlation of each pair of data types, for samples and for genes, with the sample or gene that
+has the lowest Pearson correlation.
+'''
+def printSummary(table):
+	for (axis, type_1, type_2), rows in table.groupby(correlation_columns[:1] + correlation_columns[2:4], sort = False):
+		lowest = rows.loc[rows[correlation_columns[4]].idxmin()] if rows[correlation_columns[4]].notna().any() else None
+		print("\n" + type_1 + " vs " + type_2 + " (" + str(len(rows)) + " " + axis + "s)")
+		print(" pearson:  min " + str(rows[correlation_columns[4]].min()) + "  median " + str(rows[correlation_columns[4]].median()))
+		print(" spearman: min " + str(rows[correlation_columns[5]].min()) + "  median " + str(rows[correlation_columns[5]].median()))
+		if lowest is not None:
+			print(" lowest " + axis + ": " + str(lowest[correlation_columns[1]]))
+
+'''
+robustZ is the robust (modified) z-score of every value in values against all of them: 0.6745 * (value - median) / MAD, where MAD is the
+median absolute deviation from the median. The median and MAD are not moved by the outliers themselves, unlike the mean and standard
+deviation. If more than half of the values are the same the MAD is 0, so the mean absolute deviation (scaled to match) is used instead,
+and neither is allowed below outlier_min_scale. NaN values are left out, and if every value is NaN every score is NaN.
+'''
+def robustZ(values):
+	values = np.asarray(values, dtype = float)
+	if np.isnan(values).all(): # nothing to score, np.nanmedian would warn about an all-NaN slice
+		return np.full(len(values), np.nan)
+	median = np.nanmedian(values)
+	deviation = np.abs(values - median)
+	scale = np.nanmedian(deviation) / 0.6745
+	if not scale > 0:
+		scale = np.nanmean(deviation) * 1.2533
+	scale = max(scale, outlier_min_scale) if not np.isnan(scale) else outlier_min_scale
+	return (values - median) / scale
+
+'''
+outlierTable scores the correlation of every sample in table (from correlationTable() or streamingTable()) against the other samples of the
+same pair of data types, for Pearson and Spearman, and keeps the lower of the two. The scores of all pairs come from one groupby, so the
+whole cohort is scored at once. A method without any sample correlation (Spearman when streaming) is not scored. One row per sample and pair
+is returned, with its z-score and whether it is flagged, along with the list of methods that were not scored.
+'''
+def outlierTable(table):
+	sample_rows = table[table[correlation_columns[0]] == "sample"].copy()
+	pair_columns = correlation_columns[2:4]
+	scores = []
+	not_scored = [] # methods whose sample correlations are all NaN
+	for method in correlation_columns[4:6]:
+		if sample_rows[method].isna().all():
+			not_scored.append(method)
+			scores.append(np.full(len(sample_rows), np.nan))
+			continue
+		scores.append(sample_rows.groupby(pair_columns, sort = False)[method].transform(robustZ).to_numpy())
+	sample_rows["z"] = np.fmin(scores[0], scores[1]) # the lowest of the two, ignoring NaN (no Spearman when streaming)
+	sample_rows["flagged"] = sample_rows["z"] < -outlier_threshold
+	return sample_rows, not_scored
+
+'''
+outlierReport turns the scores of outlierTable() into one row per flagged sample: how many of the pairs flagged it, its lowest z-score and the
+pair and correlations where it was lowest. The samples with the lowest scores are first.
+'''
+def outlierReport(scores):
+	scores = scores.sort_values("z", kind = "stable")
+	flagged = scores[scores["flagged"]]
+	lowest = flagged.drop_duplicates(subset = correlation_columns[1]) # the first row of each sample has its lowest z-score
+	report = pd.DataFrame({
+		outlier_columns[0]: lowest[correlation_columns[1]].to_numpy(),
+		outlier_columns[1]: flagged.groupby(correlation_columns[1])["z"].size().reindex(lowest[correlation_columns[1]]).to_numpy(),
+		outlier_columns[2]: lowest["z"].to_numpy(),
+		outlier_columns[3]: (lowest[correlation_columns[2]] + " vs " + lowest[correlation_columns[3]]).to_numpy(),
+		outlier_columns[4]: lowest[correlation_columns[4]].to_numpy(),
+		outlier_columns[5]: lowest[correlation_columns[5]].to_numpy()
+	})
+	return report
 
 def getCombinations(files):
 	combination = []
@@ -117,18 +545,63 @@ def getCombinations(files):
 	return combination
 
 
-special_case = specialCase(file_name)
+# the matrices can be parsed by worker processes (formatAll()), which import this file again on macOS and Windows, so the script
+# only runs when it is the main program.
+if __name__ == "__main__":
+	special_case = specialCase(file_name)
 
-samples = getSamples(file_name[0])
+	samples = getSamples(file_name[0])
 
-for i in range(len(file_name)):
-	files[i] = formatDf(file_name[i])
+	combinations = getCombinations(files)
 
-combinations = getCombinations(files)
+	checkHeaders(file_name)
 
-for pair in combinations:
-	if pair[0] == special_case or pair[1] == special_case:
-		PCCrow(files[pair[0]], files[pair[1]], file_name[pair[0]],file_name[pair[1]])
-	else:
-		PCCcol(files[pair[0]], files[pair[1]], samples, file_name[pair[0]], file_name[pair[1]])
+	if identity_check == True:
+		if all_samples == False: # only the sample that is correlated is checked, so only its column of each matrix is read.
+			for i in range(len(file_name)):
+				files[i] = formatColumns(file_name[i], samples[:1])
+			printIdentities(identityTable(files, file_name))
+		elif streaming == True and matrix_cache_dir == None:
+			print("\nidentity check skipped, it needs the whole matrices (or matrix_cache_dir) and streaming is on")
+		else:
+			files = formatAll(file_name)
+			checkGenes(files, file_name)
+			printIdentities(identityTable(files, file_name))
+
+	if all_samples == True and streaming == True:
+		try:
+			correlations = streamingTable(file_name, combinations)
+		except GeneOrderError as error:
+			print(error)
+			sys.exit(1)
+	elif all_samples == True:
+		if files[0] is None: # not loaded yet by the identity check
+			files = formatAll(file_name)
+			checkGenes(files, file_name)
+		correlations = correlationTable(files, file_name, combinations)
+	if all_samples == True:
+		correlations.to_csv(correlation_file, sep = '\t', index = False)
+		printSummary(correlations)
+		print("\ncorrelations written to " + correlation_file)
+		if outlier_check == True:
+			scores, not_scored = outlierTable(correlations)
+			for method in not_scored:
+				print("\noutlier check not applicable to " + method + ": there are no " + method + " sample correlations")
+			scores.to_csv(outlier_file, sep = '\t', index = False)
+			report = outlierReport(scores)
+			print("\noutlier samples (robust z-score below -" + str(outlier_threshold) + "): " + str(len(report)) + "/" + str(scores[correlation_columns[1]].nunique()))
+			if len(report) > 0:
+				print(report.to_string(index = False))
+			print("\nsample scores written to " + outlier_file)
+		sys.exit(0)
+
+	for i in range(len(file_name)):
+		if files[i] is None: # not loaded yet by the identity check
+			files[i] = formatColumns(file_name[i], samples[:1])
+		first_rows[i] = formatRow(file_name[i])
 
+	for pair in combinations:
+		if pair[0] == special_case or pair[1] == special_case:
+			PCCrow(first_rows[pair[0]], first_rows[pair[1]], file_name[pair[0]],file_name[pair[1]])
+		else:
+			PCCcol(files[pair[0]], files[pair[1]], samples, file_name[pair[0]], file_name[pair[1]])
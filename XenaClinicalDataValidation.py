@@ -1,9 +1,8 @@
-import requests
-import json
 import sys
 import pandas as pd
 import numpy as np
 import sys
+import GDCQuery
 
 '''
 	Xena clincal data validation is a script that compares clinical data that the Xena ETL code imported and clinical data 
@@ -14,8 +13,8 @@ Xena file are in opposite order (flipFields). The field: 'samples.submitter_id'
 request is 'samples.submitter_id', so we need 'samples.submitter_id' from the xena dataframe which will then be used as 
 values to include in the request (getFilter). With all of the preperation complete, a request is sent to the cases endpoint
 of the GDC, of all clinical data relevant to the fields recieved from 'getFields', and filtered by the 'samples.submitter_id'
-from "getFilter". This request returns a json response which is then unpeeled to remove uneccessary dictionaries and lists
-(unpeel). Ultimately, a list is returned by (getData). Then, the data is compared in "compareData()". Every element in 
+from "getFilter". The submitter ids are sent in chunks and every page of the response is requested, a few requests
+at a time (GDCQuery.fetchHits). Ultimately, a list is returned by (getData). Then, the data is compared in "compareData()". Every element in 
 the list response from getData() corresponds to a single case. So compareData() loops through each element. First, it 
 format the data in "formatData()" to a dictionary, where each key corresponds to a field, and each value corresponding to 
 the relevant data of that field. Some cases have multiple samples, so only those without 'ffpe scrolls' or 'blood derived normal',
@@ -66,18 +65,6 @@ keyword = ["treatments","samples.submitter_id",
  "Blood Derived Normal", "FFPE Scrolls", "submitter_id.samples"]
 
 
-'''
-unpeels unneccessary dictionaries and lists returned by GDC API. resJson is the GDC API response in Json format. However,
-after being unpeeled it is a list. 
-'''
-def unpeel(resJson): # json format
-    resJson = json.loads(resJson)
-    resJson = resJson.get("data")
-    resJson = resJson.get("hits")
-    return resJson # list. 
-
-
-
 '''
 getFields reads the first line of 'xena_file' and splits it by \t, since xena_file is a TSV. then each element in 'line'
 is stripped, and appended to 'fields', which now has the list of all fields in the xena_file.
@@ -138,39 +125,19 @@ def getFilter(xena_df):
 '''
 getData() takes in two arguments. The lsit of fields called 'fields' and the list of values for the filter, called 'filter_list'.
 fields is the list of fields read from the xena_file, while filter list is a list of submitter_ids read from the xena dataframe.
-A post request is sent to the GDC cases_endpt asking for a json response. This json response is then unpeeled into a list which 
-is what the function returns. This list has all clinical data of the fields in 'fields' from the samples in 'filter_list'.
+The submitter ids are sent to the GDC cases_endpt in chunks, and every page of the response is requested with GDCQuery.fetchHits(),
+which returns all of the cases as a list. This list has all clinical data of the fields in 'fields' from the samples in 'filter_list'.
 '''
 def getData(fields, filter_list):
-	fields = ",".join(fields) # the list of fields needs to be a comma seperated string when sent to the GDC
-
 	cases_endpt = "https://api.gdc.cancer.gov/cases" # cases endpoint
 
-	# The filter used is 'samples.submitter_id'. while 'value' is the submitter ids included in the request. 
-	filters = {
-		"op": "in",
-		"content":{
-			"field": "samples.submitter_id",
-			"value": filter_list
-			}
-	}
-
-
-	# A POST is used, so the filter parameters can be passed directly as a Dict object.
-	params = {
-    	"filters": filters,
-		"fields": fields,
-		"format": "json", #request for a json response
-    	"size": "20000"
-    	}
-
-	# The parameters are passed to 'json' rather than 'params' in this case
-	response = requests.post(cases_endpt, headers = {"Content-Type": "application/json"}, json = params)
-
-	# turns the response into a readable json called 'responseJson'
-	responseJson = json.dumps(response.json(),indent=2)
-	#unpeels 'responseJson' into a list
-	responseJson = unpeel(responseJson)
+	# The filter used is 'samples.submitter_id'. The submitter ids are split into chunks of GDCQuery.filter_chunk, so
+	# no single request carries the whole list.
+	filters = GDCQuery.chunkFilters("samples.submitter_id", filter_list)
+
+	# every page of every chunk is requested, a few at a time, and the cases are merged into one list. A case with samples
+	# in more than one chunk is only returned once.
+	responseJson = GDCQuery.fetchHits(cases_endpt, filters, fields)
 	return responseJson
 
 
@@ -1,69 +1,102 @@
 '''
 This script checks the accuracy of Xena ETL genomic data from the GDC by independently importing genomic data from the GDC 
-and comparing it to the Xena ETL data. This is done by reading the samples of the Xena file and then sending a request to 
-the GDC for the file names of the files of each sample. File names which include genomic data are saved into a list. These
-file names are then included in another request to the GDC which retrieves each of the file ids. Genomic data of these samples
-is imported from the GDC by using these file ids. The data is downloaded as a bundle which are unzipped into various TSV files
-each with all genomic data types of a single sample. The raw data in each file is put into a dataframe and formatted based on
-Xena requirements. Based upon the data type selected through the arguments, the script compares each cell of the GDC imported 
-data and the Xena data to make sure they are identical. If all samples pass 100%, the script will print out success, if not 
-the process will stop at where the error is. 
+and comparing it to the Xena ETL data. This is done by reading the samples of the Xena file and then sending a single paginated
+request to the GDC files endpoint for the gene expression file of each sample, which returns the file id, file name, md5sum 
+and size of every file together with its sample. Genomic data of these samples
+is imported from the GDC by using these file ids. The data is downloaded as a bundle which is read in stream mode, so each TSV 
+file, with all genomic data types of a single sample, is parsed in memory as it arrives without being extracted to disk. The raw data in each file is put into a dataframe and formatted based on
+Xena requirements. Based upon the data type selected through the arguments, the script compares the GDC imported data and the
+Xena data a block of samples at a time to make sure they are identical. If all samples pass 100%, the script will print out 
+success, if not every mismatching cell (gene, sample, GDC value, Xena value) is printed as a table. 
 
 
 
 Arguments: 
 
 xena file (arg[1]): 
-Use xena gene expression format. Give the asolute path of file. 
+Use xena gene expression format. Give the asolute path of file. With data type 'all', give the paths of up to four
+xena files separated by commas. The data type of each file is read from the end of its name (counts.tsv, tpm.tsv, 
+fpkm.tsv, fpkm-uq.tsv).
 
 available datatypes (arg[2]): 
 fpkm_unstranded,
 fpkm_uq_unstranded,
 tpm_unstranded,
 unstranded     (This is star counts)
+all            (Every xena file given is validated in the same pass, each GDC file is downloaded and parsed once)
 
 debug mode (arg[3]): 
 When debug mode is True, sample names, file names, ids, will all be printed out. 
 
 '''
 
-import requests
-import json
 import pandas as pd
 import numpy as np
-import subprocess
-import math
 from os import path
 import os
 import re
 import tarfile
+import tempfile
+import shutil
+import atexit
+import threading
 import sys
+import GDCDownload
+import GDCQuery
+import XenaMatrix
+
+# data type argument -> column of the GDC file
+data_type_columns = {"fpkm": "fpkm_unstranded", "fpkm_uq": "fpkm_uq_unstranded", "tpm": "tpm_unstranded", "star_counts": "unstranded"}
+# end of a xena file name -> column of the GDC file, used to tell the data type of each matrix when data_type is 'all'.
+file_suffix_columns = {"counts.tsv": "unstranded", "tpm.tsv": "tpm_unstranded", "fpkm.tsv": "fpkm_unstranded", "fpkm-uq.tsv": "fpkm_uq_unstranded"}
 
 if len(sys.argv[:]) != 4:
     print("Args: this_file   xena_file_path   data_type   debug_mode(True or False)")
+    print("      this_file   xena_file_1,xena_file_2,...   all   debug_mode(True or False)")
     sys.exit(0)
-xena_file = sys.argv[1]
-if sys.argv[2] == "fpkm":
-    data_type = "fpkm_unstranded"
-elif sys.argv[2] == "fpkm_uq":
-    data_type = "fpkm_uq_unstranded"
-elif sys.argv[2] == "tpm":
-    data_type = "tpm_unstranded"
-elif sys.argv[2] == "star_counts":
-    data_type = "unstranded"
+xena_files = {} # column of the GDC file -> xena file that is compared with it.
+if sys.argv[2] == "all":
+    for file in sys.argv[1].split(","):
+        for suffix, column in file_suffix_columns.items():
+            if file.endswith(suffix):
+                xena_files[column] = file
+    if len(xena_files) != len(sys.argv[1].split(",")):
+        print("With data type 'all', every xena file name must end with one of " + str(list(file_suffix_columns.keys())) + " and each data type can only be given once")
+        sys.exit(0)
+elif sys.argv[2] in data_type_columns:
+    xena_files[data_type_columns[sys.argv[2]]] = sys.argv[1]
 else:
-    print("Available data types are 'fpkm', 'fpkm_uq', 'tpm', 'star_counts'")
+    print("Available data types are 'fpkm', 'fpkm_uq', 'tpm', 'star_counts', 'all'")
     sys.exit(0)
 debug = False
 if sys.argv[3] == "True" or sys.argv[3] == "true":
     debug = True
 
+stream_download = True # when True the GDC bundle is parsed in memory as it downloads, when False it is saved and extracted to disk first.
+file_filters = {"analysis.workflow_type": "STAR - Counts", "data_format": "TSV"} # only files matching these fields are requested from the GDC.
+file_search = 'rna_seq.augmented_star_gene_counts.tsv' # and only files with this string in their file name are kept.
+batch_size = 50 # number of files per download in pipelined mode, 0 downloads every file in a single bundle instead.
+download_workers = 2 # number of batches downloaded at the same time in pipelined mode.
+compare_workers = 2 # number of threads comparing downloaded batches in pipelined mode.
+queue_size = 4 # number of downloaded batches that can wait to be compared before downloading pauses.
+cache_dir = None # directory where downloaded GDC files are cached by file id and md5sum, None turns the cache off.
+cache_size = 50 * 1000 ** 3 # bytes the cache can hold before the least recently used files are removed.
+xena_cache_dir = None # directory where a binary copy of each xena matrix is kept for fast reloads, None turns it off.
+xena_load_columns = False # when True the xena matrices are not loaded whole, each is parsed once into a memory mapped copy and each block reads only its own sample columns.
+compare_block_size = 64 # number of samples that are compared together in one NumPy operation.
+mismatch_columns = ["gene", "sample", "gdc_value", "xena_value"] # columns of the mismatch table returned by compareBlock()
+mismatch_rows = 20 # number of mismatches printed at the end, the per-sample summary always covers every sample.
+mismatch_file = None # where the table of every mismatch is written when there are any, None does not write it.
+gdc_genes = None # gene ids of the first GDC file, in order. Every other file is aligned to these genes.
+gene_alignment = {} # data type -> [GDC row of each shared gene, xena row of each shared gene, genes only in GDC, genes only in xena, duplicated genes]
+alignment_lock = threading.Lock() # files are parsed by several threads in pipelined mode, so the alignment is built under this lock.
+
 
 '''
 getSamples reads the first line of the xena tsv file, and retrieves all samples into a list (samples), in order.  
 '''
 
-def getSamples():
+def getSamples(xena_file):
     file = open(xena_file, "r+")
     l = file.readline()
     file.close()
@@ -75,225 +108,273 @@ def getSamples():
  
     return(sampleList)
 '''
-unpeels unneccessary dictionaries and lists returned by GDC API. resJson is the GDC API response in Json format. However,
-after being unpeeled it is not in Json format. 
+getManifest resolves the file of every sample in samples with a single paginated query to the GDC files endpoint, filtered by
+file_filters and file_search. Two dictionaries are returned, the first maps each file id to the list of samples of that file and
+the second maps each file id to its md5sum. Samples that have no file, or more than one, are printed. For a sample with more than
+one file only the first is used.
 '''
-
-def unpeel(resJson):
-    resJson = json.loads(resJson)
-    resJson = resJson.get("data")
-    resJson = resJson.get("hits")
-    return resJson
-
-'''
-findFile uses the cases endpoint to retrieve the file names of each sample through a post request. The response is unpeeled. 
-Each sample has its own dictionary of file names as well as id. First we search , so for each file name we search for
-rna_seq.augmented_star_gene_counts.tsv'. If a file name contains this string, then it will be appended to a new list called 
-file_name. 
-'''
-def findFile(samples): # samples is the list of samples from the xena_file
-    cases_endpt = "https://api.gdc.cancer.gov/cases" # we use the cases endpoint for this search and retrieval.
-    fields = "files.file_name" # The field we are searching for is the file name
-    search = 'rna_seq.augmented_star_gene_counts.tsv' # search is a string that we check in each file name we get, and if it matches, the file name is put in a list called file_list.
-    file_list = [] 
-    keys = ["files"] # We only want the file names from our response and so we only search inside values with keys named 'files'
-
-    filters = {
-        "op": "in",
-        "content":{
-            "field": "samples.submitter_id",
-            "value": samples
-            }
-    }
-
-    params = {
-        "filters": json.dumps(filters),
-        "fields": fields,
-        "format": "json",
-        "size": "20000"
-    }
-    
-    response = requests.post(cases_endpt, headers = {"Content-Type": "application/json"},  json = params)
-
-    #response is the Json response we get from the GDC after sending a POST request.
-
-    # responseJson is our response in a more readable Json format. Once unpeeled however, it is a list containing
-    # the id and file names of each sample.
-    responseJson = json.dumps(response.json(),indent=2)
+def getManifest(samples):
+    manifest = GDCQuery.resolveManifest(samples, file_filters, file_search)
     if debug == True:
-        print("\n Json formatted response of all file names: ")
-        print(responseJson)
-    responseJson = unpeel(responseJson)
-    
-    for i in responseJson: # i is a dictionary in the responseJson list which correspondes to a single sample.
-      
-        item = [] 
-        for key, value in i.items(): 
-            if key in keys: # if this specific key in i is equal to 'files', then its value will be the list, item. 
-                item = value # item now is a list of the file names of all files in a specific sample (as well as the sample ids.)
-                for i in item:
-                    file = i["file_name"] # each element in the item list is a dictionary and if that dictionary's key is 'file_name' 
-                    if file.find(search) != -1: # then we check if the value( file name) matches our search string.
-                        file_list.append(file) # if it does, it is appended to a new list of the files we want to download. 
-                        break
-                break
-    return file_list
+        print("\n manifest [sample, file id, file name, md5sum, file size]: ")
+        print(manifest.to_string())
+    duplicated = manifest[manifest.duplicated(subset = "sample", keep = False)]
+    if len(duplicated) > 0:
+        print("\n samples with more than one file, only the first file is compared: ")
+        print(duplicated.to_string())
+    manifest = manifest.drop_duplicates(subset = "sample")
+    missing = sorted(set(samples) - set(manifest["sample"]))
+    if len(missing) > 0:
+        print("\n samples without a file in the GDC: ")
+        print(missing)
+    uuid_samples = {}
+    for sample, uuid in zip(manifest["sample"], manifest["file_id"]):
+        uuid_samples.setdefault(uuid, []).append(sample)
+    uuid_md5 = dict(zip(manifest["file_id"], manifest["md5sum"]))
+    return uuid_samples, uuid_md5
+
+
+# XenaFormat converts the already formatted xena file provided by the user into a xena formatted data frame. If xena_cache_dir is set,
+# the matrix is opened from its binary copy instead of being parsed. With xena_load_columns but no xena_cache_dir, the binary copy is
+# built once in a temporary directory that is removed when the script exits: the file is parsed a chunk of rows at a time and the values
+# are memory mapped, so the whole matrix is never in memory. Values are rounded to 10 decimals when they are compared.
 
-'''
-getFile is a function that uses the list of file names retrived from the findFile function and sends another request to the GDC
-for their file ids. 
-'''    
-
-def getFile(file): # file is a list of file_names that we want ids of
-
-    file_endpt = "https://api.gdc.cancer.gov/files" #We use the files endpoint this time
-
-    filters = {
-        "op": "in",
-        "content":{
-            "field": "file_name",
-            "value": file
-            }
-    }
-
-    fields = "file_id"
-    params = {
-        "filters": json.dumps(filters),
-        "fields": fields,
-        "format": "json",
-        "size": "100"
-        }
-
-    response = requests.post(file_endpt, headers = {"Content-Type": "application/json"},  json = params)
-    #response is the Json response we get from the GDC after sending a POST request.
-
-    #response Json is response in a more readable format. 
-    responseJson = json.dumps(response.json(),indent=2)
-    if debug == True:
-        print("\n Json formatted response of all file ids: ")
-        print(responseJson)
-    responseJson = unpeel(responseJson)
+def xenaFormat(xena_file): 
+    cache = xena_cache_dir
+    if cache == None and xena_load_columns == True:
+        cache = tempfile.mkdtemp(prefix = "xena_matrix_")
+        atexit.register(shutil.rmtree, cache, True)
+    xena_format = XenaMatrix.loadMatrix(xena_file, cache)
+    return xena_format
 
-    file_id_list = [] # file_id_list will be a list containing all the file ids.
-    for i in responseJson: # i is a dictionary containing a key called 'file_id' and a value that is the file id. 
-        file = i["file_id"]
-        file_id_list.append(file) # we append the value of i to file_id_list. 
 
-    return file_id_list
+# xenaBlock returns the values of block_samples in the xena matrix of data_type as an array with one column per sample. When the matrix
+# is memory mapped (xena_cache_dir or xena_load_columns), only the columns of these samples are read from disk.
 
+def xenaBlock(data_type, block_samples):
+    return xena_data[data_type][block_samples].to_numpy()
 
-# XenaFormat converts the already formatted xena file provided by the user into a xena formatted data frame.
 
-def xenaFormat(xena_file): 
-    xena_format = pd.read_csv(xena_file ,sep = '\t', index_col=0)
-    xena_format = xena_format.round(10)
-    return xena_format
+'''
+compareBlock is the comparison engine. gdc_block and xena_block are 2-D arrays of the same shape where every column is one
+sample and every row is one gene. All cells are compared in a single NumPy operation and two NaN cells count as a match. Instead
+of stopping at the first difference, every mismatch is returned as a row in a dataframe with the gene, sample, GDC value and 
+Xena value. An empty dataframe means the whole block matched.
+'''
+def compareBlock(gdc_block, xena_block, genes, sample_names):
+    gdc_block = np.asarray(gdc_block, dtype = float)
+    xena_block = np.asarray(xena_block, dtype = float)
+    match = (gdc_block == xena_block) | (np.isnan(gdc_block) & np.isnan(xena_block))
+    rows, cols = np.nonzero(~match) # positions of every cell that did not match
+    mismatches = pd.DataFrame({
+        mismatch_columns[0]: np.asarray(genes)[rows],
+        mismatch_columns[1]: np.asarray(sample_names)[cols],
+        mismatch_columns[2]: gdc_block[rows, cols],
+        mismatch_columns[3]: xena_block[rows, cols]
+    })
+    return mismatches
 
 
-#compare files downloads all of the gene expression files in the selected samples by using the file's id. After extracting them all,
-#compare files then goes through each sample's data and compare their values to the provided xena data. If every cell matches, it
-#will move on to the next sample until complete. If all values match the program considers it a success, however if there is a difference
-# the loop will break.
+'''
+alignGenes makes sure a GDC dataframe (indexed by gene id) has its genes in the same order as gdc_genes, the genes of the first file.
+The first file sets gdc_genes, and for every xena matrix an index is built once with the GDC row and the xena row of each gene that is
+in both, as well as the genes that are only on one side. Gene ids that appear more than once (in the GDC file or the xena matrix) are
+kept as well, as they can not be matched one to one: only the first GDC row of such a gene is used. All files from the same GDC release
+have the same genes in the same order, so this is only a quick check. A file with different genes is reindexed to gdc_genes and its
+missing genes become NaN (and mismatches).
+'''
+def alignGenes(gdc_data, file):
+    global gdc_genes
+    with alignment_lock:
+        if gdc_genes is None:
+            gdc_genes = gdc_data.index
+            gdc_first = np.nonzero(~gdc_genes.duplicated())[0] # row of the first time each GDC gene appears
+            gdc_unique = gdc_genes[gdc_first] # get_indexer needs unique gene ids
+            for data_type in xena_files:
+                xena_genes = xena_gene_index[data_type]
+                gdc_rows = gdc_unique.get_indexer(xena_genes) # the GDC gene of each xena gene, -1 if the gene is not in the GDC file
+                xena_rows = np.nonzero(gdc_rows >= 0)[0]
+                only_gdc = gdc_unique[~gdc_unique.isin(xena_genes)]
+                only_xena = xena_genes[gdc_rows < 0]
+                duplicated = gdc_genes[gdc_genes.duplicated()].union(xena_genes[xena_genes.duplicated()])
+                gene_alignment[data_type] = [gdc_first[gdc_rows[xena_rows]], xena_rows, only_gdc, only_xena, duplicated]
+    if gdc_data.index.equals(gdc_genes):
+        return gdc_data
+    print("\n genes of " + file + " are not the same as the first file, it is aligned by gene id")
+    gdc_data = gdc_data[~gdc_data.index.duplicated()] # reindex needs unique gene ids
+    return gdc_data.reindex(gdc_genes)
+
+
+#compareSamples stacks the GDC values of a block of samples into one array and compares it with the same sample columns of the xena data
+#of data_type. Both sides are gathered through the gene alignment, so only genes in both files are compared, whatever their order.
+#The data type is added to the mismatch dataframe as its first column.
+def compareSamples(data_type, block_samples, block_values):
+    gdc_rows, xena_rows = gene_alignment[data_type][:2]
+    gdc_block = np.column_stack(block_values)[gdc_rows]
+    xena_block = np.round(xenaBlock(data_type, block_samples)[xena_rows], 10)
+    if debug == True:
+        print("\n cells compared (" + data_type + "): ")
+        print(gdc_block.size)
+    mismatches = compareBlock(gdc_block, xena_block, xena_gene_index[data_type][xena_rows], block_samples)
+    mismatches.insert(0, "data_type", data_type)
+    return mismatches
+
+
+#validateFiles goes through each downloaded file (file id, file name, bytes) in gdc_files. Each file is parsed once, and the values of
+#every data type that has a xena matrix are transformed with log2(x+1) and collected. Once compare_block_size samples of a data type are
+#collected, the whole block is compared to that xena matrix at once with compareBlock(). Files arrive in bundle order, so the samples 
+#of each file are looked up by file id in uuid_samples. A list of mismatch dataframes is returned.
+def validateFiles(gdc_files):
+    mismatch_list = [] # mismatch dataframes returned by compareSamples(), one per block.
+    block_samples = {} # data type -> sample names of the block that is being collected
+    block_values = {} # data type -> GDC values of the block that is being collected, one array per sample.
+    for data_type in xena_files:
+        block_samples[data_type] = []
+        block_values[data_type] = []
+    for uuid, file, raw_data in gdc_files:
+        # format data downloaded and convert into pd dataframe.
+        data = GDCDownload.readTable(raw_data, skiprows = 1, index_col=0)
+        data = data.drop(['N_unmapped', 'N_multimapping', 'N_noFeature', 'N_ambiguous'])
+        gdc_data = pd.DataFrame(np.log2(data[list(xena_files.keys())] + 1)) # every data type is transformed in the same pass
+        gdc_data = gdc_data.round(10)
+        gdc_data = alignGenes(gdc_data, file)
+        for sample_name in uuid_samples[uuid]:
+            if debug == True:
+                print("\n sample name:")
+                print(sample_name)
+                print("\n file name: ")
+                print(file)
+                print("\n file id: ")
+                print(uuid)
+                print("\n imported data from the GDC dataframe of specified datatypes: ")
+                print(gdc_data)
+            for data_type in xena_files:
+                if sample_name not in xena_samples[data_type]:
+                    continue
+                block_samples[data_type].append(sample_name)
+                block_values[data_type].append(gdc_data[data_type].to_numpy())
+                # once the block is full the whole block is compared at once.
+                if len(block_samples[data_type]) == compare_block_size:
+                    mismatch_list.append(compareSamples(data_type, block_samples[data_type], block_values[data_type]))
+                    block_samples[data_type] = []
+                    block_values[data_type] = []
+    for data_type in xena_files:
+        if len(block_samples[data_type]) > 0: # the last block is usually not full
+            mismatch_list.append(compareSamples(data_type, block_samples[data_type], block_values[data_type]))
+    return mismatch_list
+
+
+#compare files downloads all of the gene expression files in the selected samples by using the file's id and validates them with validateFiles().
+#Files already in the download cache (if cache_dir is set) are read from disk and only the missing files are requested from the GDC.
+#In pipelined mode (batch_size more than 0) the file ids are split into batches. Several batches are downloaded at once and each batch is
+#validated by a pool of threads as soon as it has arrived, so downloading and comparing overlap. Otherwise, in streaming mode the bundle
+#is read straight from the GDC response and each file is parsed in memory as soon as it arrives, or the bundle is saved and extracted
+#to disk first. Every mismatch of every sample and data type is kept in a single dataframe, so one bad cell no longer hides the rest of
+#the sample. The number of mismatches of each sample and the first mismatch_rows of them are printed at the end, and the whole table is
+#written to mismatch_file if it is set. A dictionary with the number of samples that passed for each data type is returned.
 def compareFiles():
-    # Payload is list of file ids in Json format 
-    payload = {"ids": file_uuid}
-
     if debug == True: 
         print("\n file_uuids:")
         print(file_uuid)
 
-    with open("request.txt", "w") as request: # writes payload to a txt file called request.txt
-        request.write(str(payload).replace("\'", "\"")) # however, all single quotations must be replaced with double quotations for the download to work. 
-        if debug == True:
-            print("\n Payload format: ")
-            print(request)
-    # request.txt includes all of file ids that will be used in a download request of those files. 
-    #They are to be downloaded to the file: gdc_download.tar.gz
-    #once extracted, this file is a directory with nested directories named after file ids of each file. Inside these nested directories 
-    # is one file for each directory. 
     print("\n Importing from GDC: ")
-    subprocess.run(["curl", "-o", "gdc_download.tar.gz", "--remote-name", "--remote-header-name", "--request", "POST", "--header", "Content-Type: application/json", "--data", "@request.txt", 'https://api.gdc.cancer.gov/data'])  
-    gdc_download = tarfile.open("gdc_download.tar.gz")
-
-    gdc_download.extractall("gdc_download")
-    gdc_download.close()
-    marker = 0 
-    samples_passed = 0 # samples passed increases by one for every sample (file) checked.
-    for uuid in file_uuid:
-
-        compare_values = 0  # compare values keeps track of the number of cells compare and if it matches the length of the dataframe
-        sample_name = samples[marker]
-        # format data downloaded and convert into pd dataframe. First need to find the file using its path.
-        file = os.listdir("gdc_download/" + uuid)
-        data = pd.read_csv("gdc_download/" + uuid + "/" + file[0], sep ='\t', skiprows = 1, index_col=0)
-        data[data_type] = data[data_type] + 1
-        gdc_data = pd.DataFrame(np.log2(data[data_type]))
-        gdc_data = gdc_data.round(10)
-        gdc_data = gdc_data.drop(['N_unmapped', 'N_multimapping', 'N_noFeature', 'N_ambiguous'])
-        if debug == True:
-            print("\n sample name:")
-            print(sample_name)
-            print("\n file name: ")
-            print(file)
-            print("\n file id: ")
-            print(uuid)
-            print("\n imported data from the GDC dataframe of specified datatype: ")
-            print(gdc_data)
-        # Compare cells in GDC data with Xena data , if any do not match, loop will break.
-        for item in range(len(gdc_data)):
-            cell1 = gdc_data.iloc[item][data_type]
-            cell2 = xena_data.iloc[item][sample_name]
-            if cell1 == cell2:
-                compare_values = compare_values + 1
-            elif pd.isna(gdc_data.iloc[item][data_type]) and pd.isna(xena_data.iloc[item][sample_name]):
-                compare_values = compare_values + 1
-            else:
-                print("Sample Id: ")
-                print(sample_name)
-                print("\n GDC download value: ")
-                print(gdc_data.iloc[item][data_type])
-                print("\n gene id:  ")
-                print(gdc_data.loc[item]['gene_id'])
-                print("\n Xena format value:" )
-                print(xena_data.iloc[item][sample_name])
-                print("\n Ensembl ID: ")
-                print(xena_data.loc[item]['Ensembl_ID'])
-                print("\n Row number: ")
-                print(item)
-                break
-                break
-        marker = marker + 1
-        if compare_values == len(gdc_data):
-            samples_passed = samples_passed + 1
-            if debug == True:
-                print("\n cells compared: ")
-                print(compare_values)
+    if batch_size > 0:
+        results = GDCDownload.pipelineFiles(file_uuid, validateFiles, batch_size = batch_size, 
+            download_workers = download_workers, validate_workers = compare_workers, queue_size = queue_size,
+            cache_dir = cache_dir, md5sums = uuid_md5, cache_size = cache_size)
+    else:
+        if stream_download == True or cache_dir != None:
+            # yields the file id, file name and bytes of each file, from the cache or as it arrives.
+            gdc_files = GDCDownload.streamFiles(file_uuid, cache_dir = cache_dir, md5sums = uuid_md5, cache_size = cache_size)
         else:
-            print("\nerror or data does not match")
+            # all of the file ids are downloaded in chunks to the file: gdc_download.tar.gz, resuming the download if it is interrupted.
+            #once extracted, this file is a directory with nested directories named after file ids of each file. Inside these nested directories 
+            # is one file for each directory. 
+            GDCDownload.downloadFile(file_uuid, "gdc_download.tar.gz")
+            gdc_download = tarfile.open("gdc_download.tar.gz")
+
+            gdc_download.extractall("gdc_download")
+            gdc_download.close()
+            gdc_files = GDCDownload.extractedFiles(file_uuid, "gdc_download")
+        results = [validateFiles(gdc_files)]
+    failed_samples = [] # [data type, sample] that had at least one mismatch.
+    mismatch_list = [] # mismatch dataframes of every block of every batch.
+    for batch_mismatches in results:
+        mismatch_list.extend(batch_mismatches)
+    mismatch_df = pd.DataFrame(columns = ["data_type"] + mismatch_columns)
+    if len(mismatch_list) > 0:
+        mismatch_df = pd.concat(mismatch_list, ignore_index = True)
+    for data_type, name in mismatch_df[["data_type", mismatch_columns[1]]].drop_duplicates().itertuples(index = False):
+        failed_samples.append([data_type, name])
+    if len(mismatch_df) > 0:
+        print("\nerror or data does not match")
+        print("\nSamples with mismatches: ")
+        print(mismatch_df.groupby(["data_type", mismatch_columns[1]]).size())
+        print("\nfirst " + str(min(mismatch_rows, len(mismatch_df))) + " of " + str(len(mismatch_df)) + " mismatches [data type, gene, sample, GDC value, Xena value]: ")
+        print(mismatch_df.head(mismatch_rows).to_string())
+        if mismatch_file != None:
+            mismatch_df.to_csv(mismatch_file, sep = '\t', index = False)
+            print("\nall mismatches written to " + mismatch_file)
+    failed_types = [] # data types whose genes are not the same in the GDC files and the xena file, none of their samples pass.
+    for data_type in gene_alignment: # genes that are only on one side, or more than once, are an error of the whole data type.
+        only_gdc = gene_alignment[data_type][2]
+        only_xena = gene_alignment[data_type][3]
+        duplicated = gene_alignment[data_type][4]
+        if len(only_gdc) > 0 or len(only_xena) > 0 or len(duplicated) > 0:
+            failed_types.append(data_type)
+            print("\n" + data_type + ": the genes of the GDC files and the xena file are not the same, " + str(len(gene_alignment[data_type][1])) + " genes compared")
+            print(" genes only in the GDC files (" + str(len(only_gdc)) + "): ")
+            print(list(only_gdc))
+            print(" genes only in the xena file (" + str(len(only_xena)) + "): ")
+            print(list(only_xena))
+            print(" genes that appear more than once (" + str(len(duplicated)) + "): ")
+            print(list(duplicated))
+    failed_samples = set(map(tuple, failed_samples))
+    samples_passed = {} # data type -> number of samples with a file and without a mismatch.
+    for data_type in xena_files:
+        samples_passed[data_type] = 0
+        if data_type in failed_types:
+            continue
+        for uuid in file_uuid:
+            for sample_name in uuid_samples[uuid]:
+                if sample_name in xena_samples[data_type] and (data_type, sample_name) not in failed_samples:
+                    samples_passed[data_type] = samples_passed[data_type] + 1
     return samples_passed
 
-samples = getSamples() # samples is a list of all samples in the Xena file
+xena_samples = {} # data type -> set of samples in that xena file
+samples = [] # samples is a list of all samples in the Xena files, in order.
+for data_type, xena_file in xena_files.items():
+    xena_sample_list = getSamples(xena_file)
+    xena_samples[data_type] = set(xena_sample_list)
+    samples.extend(xena_sample_list)
+samples = list(dict.fromkeys(samples)) # a sample in more than one file is only kept once.
 if debug == True:
     print("\n arguments: ")
     print(sys.argv[:])
     print("\n list of all samples: ")
     print(samples)
 
-file_name = findFile(samples) #file_name is a list of all the names of the files we want to download. 
-if debug == True:
-    print("\n list of all file names (they are not in order): ")
-    print(file_name)
-file_uuid = getFile(file_name) # file_uuid is the list of all of the ids of the files we want to download. 
+uuid_samples, uuid_md5 = getManifest(samples) # uuid_samples maps each file id we want to download to its samples, uuid_md5 to its md5sum.
+file_uuid = list(uuid_samples.keys()) # file_uuid is the list of all of the ids of the files we want to download. 
 if debug == True:
     print("\n list of all file ids: ")
     print(file_uuid)
-xena_data = xenaFormat(xena_file) # xena_data is a data frame of the provided data.
-if debug == True:
-    print("\n \n Xena format DataFrame: \n")
-    print(xena_data)
-samples_pass = compareFiles() # samples_pass is the number of samples that were 100% accurate.
-
-if samples_pass == len(samples): # checks if the number of smaples passed is equal to the number of samples. 
-    print("\n samples compared: ")
-    print(samples_pass)
-    print("\nSuccess")
\ No newline at end of file
+xena_data = {} # data type -> data frame of the provided xena file, memory mapped if xena_cache_dir or xena_load_columns is set.
+xena_gene_index = {} # data type -> gene ids of the provided xena file, in order.
+for data_type, xena_file in xena_files.items():
+    xena_data[data_type] = xenaFormat(xena_file)
+    xena_gene_index[data_type] = xena_data[data_type].index
+    if debug == True:
+        print("\n \n Xena format DataFrame (" + data_type + "): \n")
+        print(xena_data[data_type])
+samples_pass = compareFiles() # samples_pass is the number of samples that were 100% accurate for each data type.
+
+for data_type, xena_file in xena_files.items():
+    print("\n" + xena_file + " (" + data_type + ")")
+    if samples_pass[data_type] == len(xena_samples[data_type]): # checks if the number of smaples passed is equal to the number of samples. 
+        print(" samples compared: ")
+        print(samples_pass[data_type])
+        print("Success")
+    else:
+        print(" samples passed: " + str(samples_pass[data_type]) + "/" + str(len(xena_samples[data_type])))
+        print("Failed")
\ No newline at end of file
@@ -0,0 +1,274 @@
+'''
+This script checks a Xena gene-level copy number matrix (genes as rows, samples as columns) against the copy number segments of the
+GDC. The Xena-GDC-ETL derives the gene-level values from the segments, so the script does the same independently: it reads the samples
+of the Xena file, finds the segment file of every sample with a single paginated request to the GDC files endpoint and downloads them
+in stream mode. The value of each gene is taken from the segments that overlap the gene's coordinates, which are read from a local gene
+annotation file. Instead of looping over genes and segments, the segments of a sample are sorted once and every gene is placed among them
+with a single np.searchsorted, so a sample of 60,000 genes takes milliseconds. The values are then compared with the column of that sample
+in the Xena matrix, and every gene that does not match is printed as a table at the end.
+
+
+Arguments:
+
+xena file (arg[1]):
+Xena gene-level copy number matrix (.tsv). The first column is the gene id and every other column is a sample.
+
+gene annotation file (arg[2]):
+Tab separated file with one row per gene and the columns in annotation_columns: gene id (the same ids as the Xena matrix), chromosome,
+start and end. Chromosome names may be given with or without the 'chr' prefix.
+
+file type (arg[3], optional):
+Type of GDC segment file the matrix was made from, one of the keys of gene_file_types (ascat-ngs, ascat2 or ascat3). When it is not given,
+the type is read from the end of the xena file's name (see xena_suffix in gene_file_types).
+
+example: python3 XenaGeneLevelCopyNumberValidation.py /Users/Downloads/TCGA-BRCA.gene-level_ascat2.tsv /Users/Downloads/gencode.v36.genes.tsv
+'''
+
+import re
+import sys
+import numpy as np
+import pandas as pd
+import GDCDownload
+import GDCQuery
+import XenaMatrix
+
+
+if len(sys.argv[:]) not in [3, 4]:
+    print("Args: this_file   xena_file_path   gene_annotation_file   [file_type]")
+    sys.exit(0)
+
+xena_file = sys.argv[1]
+annotation_file = sys.argv[2]
+file_type = None # type of GDC segment file, read from the xena file name by fileType() unless it is given
+if len(sys.argv[:]) == 4:
+    file_type = sys.argv[3]
+
+
+#### CONSTANTS ########################################
+file_filters = {"data_category": "Copy Number Variation", "data_format": "TXT"} # only files matching these fields are requested from the GDC
+# GDC segment file types that a gene-level matrix can be made from. For each type: a regular expression that the GDC file name must match
+# (the same patterns as cnv_file_types in CopyNumberTesting.py) and the end of the name of the xena gene-level file of that type.
+gene_file_types = {
+    "ascat-ngs": {"pattern": r"copy_number_variation\.seg\.txt$", "xena_suffix": "gene-level_ascat-ngs.tsv"},
+    "ascat2": {"pattern": r"ascat2\.allelic_specific\.seg\.txt$", "xena_suffix": "gene-level_ascat2.tsv"},
+    "ascat3": {"pattern": r"ascat3\.allelic_specific\.seg\.txt$", "xena_suffix": "gene-level_ascat3.tsv"}
+}
+default_file_type = "ascat-ngs" # type of a xena file whose name does not end with any xena_suffix
+segment_columns = ["Chrom", "Start", "End", "value"] # columns 2 to 5 of a GDC seg file (the first is the aliquot)
+annotation_columns = ["gene_id", "chrom", "start", "end"] # columns of the gene annotation file
+overlap_rule = "min" # value of a gene that overlaps more than one segment: "min", "max", or "single" (NaN unless all segments agree).
+value_tolerance = 0 # largest difference between a GDC and a Xena value that still counts as a match, 0 compares them exactly.
+chrom_span = 10 ** 10 # longer than any chromosome, used to turn (chromosome, position) into one sortable number.
+cache_dir = None # directory where downloaded GDC files are cached by file id and md5sum, None turns the cache off.
+cache_size = 50 * 1000 ** 3 # bytes the cache can hold before the least recently used files are removed.
+xena_cache_dir = None # directory where a binary copy of the xena matrix is kept for fast reloads, None turns it off.
+mismatch_rows = 20 # number of mismatching genes printed at the end, the per-sample summary always covers every sample.
+mismatch_columns = ["sample", "gene", "gdc_value", "xena_value"] # columns of the mismatch table
+
+
+'''
+fileType is the segment file type of a xena file, the type whose xena_suffix the file name ends with, or default_file_type if there is none.
+'''
+def fileType(xena_file):
+    for gene_type, type_info in gene_file_types.items():
+        if xena_file.endswith(type_info["xena_suffix"]):
+            return gene_type
+    return default_file_type
+
+
+'''
+chromName removes the 'chr' prefix of chromosome names, so chr1 and 1 are the same chromosome.
+'''
+def chromName(chroms):
+    return pd.Series(chroms).astype(str).str.replace("^chr", "", regex = True).to_numpy()
+
+
+'''
+readAnnotation reads the gene annotation file and returns the coordinates of the genes in genes (the rows of the xena matrix), in the same
+order. Every chromosome is given a number, and the start and end of each gene become chrom number * chrom_span + position, so genes (and
+later segments) on all chromosomes can be searched in a single sorted array. The chromosome numbers are returned as a dictionary so that
+segments use the same ones. Genes without coordinates are returned separately and are not compared.
+'''
+def readAnnotation(annotation_file, genes):
+    annotation = pd.read_csv(annotation_file, sep = '\t', usecols = annotation_columns, dtype = {annotation_columns[1]: str})
+    annotation = annotation.drop_duplicates(subset = annotation_columns[0]).set_index(annotation_columns[0])
+    annotated = genes[genes.isin(annotation.index)]
+    unannotated = genes[~genes.isin(annotation.index)]
+    annotation = annotation.loc[annotated]
+    chroms = chromName(annotation[annotation_columns[1]])
+    chrom_codes = {}
+    for chrom in pd.unique(chroms):
+        chrom_codes[chrom] = len(chrom_codes)
+    offsets = np.array([chrom_codes[chrom] for chrom in chroms], dtype = np.int64) * chrom_span
+    gene_start = offsets + annotation[annotation_columns[2]].to_numpy(dtype = np.int64)
+    gene_end = offsets + annotation[annotation_columns[3]].to_numpy(dtype = np.int64)
+    return annotated, gene_start, gene_end, chrom_codes, unannotated
+
+
+'''
+overlapValues is used by geneValues() when the segments of a sample overlap each other, so their ends are not in order and the segments
+between the two np.searchsorted bounds do not all overlap the gene. The running maximum of the segment ends is in order, so it still gives
+the first segment that can overlap each gene, and the segments from there to the last one starting before the gene's end are checked one
+gene at a time. The lowest and highest value of the segments that overlap each gene are returned, with whether any segment overlaps it.
+'''
+def overlapValues(seg_start, seg_end, seg_value, gene_start, gene_end):
+    first = np.searchsorted(np.maximum.accumulate(seg_end), gene_start, side = "left")
+    last = np.searchsorted(seg_start, gene_end, side = "right")
+    lowest = np.full(len(gene_start), np.nan)
+    highest = np.full(len(gene_start), np.nan)
+    overlaps = np.zeros(len(gene_start), dtype = bool)
+    for gene in np.nonzero(first < last)[0]:
+        candidates = slice(first[gene], last[gene])
+        values = seg_value[candidates][seg_end[candidates] >= gene_start[gene]]
+        if len(values) > 0:
+            lowest[gene] = values.min()
+            highest[gene] = values.max()
+            overlaps[gene] = True
+    return lowest, highest, overlaps
+
+
+'''
+geneValues gives every gene the copy number of the segments of one sample that overlap it. The segments are sorted by their position
+on all chromosomes together. For each gene, the first segment ending at or after its start and the last segment starting at or before its
+end are found with np.searchsorted, so every segment in between overlaps the gene. The lowest and highest value of those segments come from
+np.minimum.reduceat and np.maximum.reduceat, which reduce every gene's range of segments in one call. Genes that no segment overlaps are NaN.
+This needs segments that do not overlap, so that once sorted by start their ends are in order as well. If they are not, the genes are
+matched with overlapValues() instead.
+'''
+def geneValues(segments, gene_start, gene_end, chrom_codes):
+    codes = pd.Series(chromName(segments[segment_columns[0]])).map(chrom_codes).to_numpy(dtype = float)
+    known = ~np.isnan(codes) # segments on chromosomes without any annotated gene are left out
+    offsets = codes[known].astype(np.int64) * chrom_span
+    seg_start = offsets + segments[segment_columns[1]].to_numpy(dtype = np.int64)[known]
+    seg_end = offsets + segments[segment_columns[2]].to_numpy(dtype = np.int64)[known]
+    seg_value = segments[segment_columns[3]].to_numpy(dtype = float)[known]
+    order = np.argsort(seg_start, kind = "stable")
+    seg_start = seg_start[order]
+    seg_end = seg_end[order]
+    seg_value = seg_value[order]
+    if not np.all(np.diff(seg_end) >= 0): # the chromosome offsets keep the ends of different chromosomes in order, so only overlaps fail this
+        print("\n segments overlap each other, genes are matched one at a time")
+        lowest, highest, overlaps = overlapValues(seg_start, seg_end, seg_value, gene_start, gene_end)
+        return chooseValue(lowest, highest, overlaps)
+    first = np.searchsorted(seg_end, gene_start, side = "left") # first segment that ends at or after the start of the gene
+    last = np.searchsorted(seg_start, gene_end, side = "right") # one past the last segment that starts at or before the end of the gene
+    overlaps = first < last
+    # reduceat reduces values[bounds[k]:bounds[k + 1]], so with bounds first, last, first, last, ... every even result is one gene.
+    # A NaN is added at the end so that a bound equal to the number of segments is still a valid index.
+    padded = np.append(seg_value, np.nan)
+    bounds = np.column_stack([first, last]).ravel()
+    lowest = np.minimum.reduceat(padded, bounds)[::2]
+    highest = np.maximum.reduceat(padded, bounds)[::2]
+    return chooseValue(lowest, highest, overlaps)
+
+
+'''
+chooseValue picks the value of every gene from the lowest and highest value of its segments, following overlap_rule. Genes that no
+segment overlaps are NaN.
+'''
+def chooseValue(lowest, highest, overlaps):
+    if overlap_rule == "max":
+        values = highest
+    elif overlap_rule == "single":
+        values = np.where(lowest == highest, lowest, np.nan)
+    else:
+        values = lowest
+    return np.where(overlaps, values, np.nan)
+
+
+'''
+compareValues compares the gene values computed from the GDC segments of one sample with the xena values of that sample. Two NaN values
+count as a match. The mismatching genes are returned as a dataframe.
+'''
+def compareValues(sample, genes, gdc_values, xena_values):
+    xena_values = np.asarray(xena_values, dtype = float)
+    match = (np.abs(gdc_values - xena_values) <= value_tolerance) | (np.isnan(gdc_values) & np.isnan(xena_values))
+    rows = np.nonzero(~match)[0]
+    return pd.DataFrame({
+        mismatch_columns[0]: sample,
+        mismatch_columns[1]: np.asarray(genes)[rows],
+        mismatch_columns[2]: gdc_values[rows],
+        mismatch_columns[3]: xena_values[rows]
+    })
+
+
+'''
+getManifest finds the segment file of every sample with one paginated query to the files endpoint. Only files whose name matches the
+pattern of file_type are kept. Samples without a file, or with more than one (only the first is used), are printed. A dictionary from each file id to its sample and one to its md5sum are returned.
+'''
+def getManifest(samples, file_type):
+    manifest = GDCQuery.resolveManifest(samples, file_filters)
+    pattern = re.compile(gene_file_types[file_type]["pattern"])
+    manifest = manifest[[pattern.search(file_name) != None for file_name in manifest["file_name"]]]
+    duplicated = manifest[manifest.duplicated(subset = "sample", keep = False)]
+    if len(duplicated) > 0:
+        print("\n samples with more than one segment file, only the first file is compared: ")
+        print(duplicated.to_string())
+    manifest = manifest.drop_duplicates(subset = "sample")
+    missing = sorted(set(samples) - set(manifest["sample"]))
+    if len(missing) > 0:
+        print("\n samples without a segment file in the GDC: ")
+        print(missing)
+    uuid_sample = dict(zip(manifest["file_id"], manifest["sample"]))
+    uuid_md5 = dict(zip(manifest["file_id"], manifest["md5sum"]))
+    return uuid_sample, uuid_md5
+
+
+'''
+compareSamples downloads the segment file of every sample (from the cache if cache_dir is set), computes its gene values and compares them
+with the xena matrix as soon as each file arrives. A list of the samples that passed and a dataframe of every mismatch are returned.
+'''
+def compareSamples(uuid_sample, uuid_md5, xena_df, genes, gene_start, gene_end, chrom_codes):
+    samples_passed = []
+    mismatch_list = []
+    gdc_files = GDCDownload.streamFiles(list(uuid_sample.keys()), cache_dir = cache_dir, md5sums = uuid_md5, cache_size = cache_size)
+    for uuid, file, raw_data in gdc_files:
+        sample = uuid_sample[uuid]
+        data = GDCDownload.readTable(raw_data, skiprows = 1, index_col = 0, header = None)
+        data = data.iloc[:, :len(segment_columns)]
+        data.columns = segment_columns
+        gdc_values = geneValues(data, gene_start, gene_end, chrom_codes)
+        mismatches = compareValues(sample, genes, gdc_values, xena_df.loc[genes, sample].to_numpy())
+        if len(mismatches) == 0:
+            samples_passed.append(sample)
+        else:
+            mismatch_list.append(mismatches)
+    mismatch_df = pd.DataFrame(columns = mismatch_columns)
+    if len(mismatch_list) > 0:
+        mismatch_df = pd.concat(mismatch_list, ignore_index = True)
+    return samples_passed, mismatch_df
+
+
+if file_type == None:
+    file_type = fileType(xena_file)
+if file_type not in gene_file_types:
+    print(file_type + " is not a file type, the types are: " + ", ".join(gene_file_types.keys()))
+    sys.exit(0)
+print("\n segment file type: " + file_type)
+
+xena_df = XenaMatrix.loadMatrix(xena_file, xena_cache_dir)
+samples = list(xena_df.columns)
+genes, gene_start, gene_end, chrom_codes, unannotated = readAnnotation(annotation_file, xena_df.index)
+if len(unannotated) > 0:
+    print("\n genes of the xena file that are not in the annotation file, they are not compared (" + str(len(unannotated)) + "): ")
+    print(list(unannotated))
+
+uuid_sample, uuid_md5 = getManifest(samples, file_type)
+print("\n Importing from GDC: ")
+samples_passed, mismatch_df = compareSamples(uuid_sample, uuid_md5, xena_df, genes, gene_start, gene_end, chrom_codes)
+
+if len(mismatch_df) > 0:
+    print("\n mismatching genes per sample: ")
+    print(mismatch_df.groupby(mismatch_columns[0]).size().to_string())
+    print("\n first " + str(min(mismatch_rows, len(mismatch_df))) + " of " + str(len(mismatch_df)) + " mismatches [sample, gene, GDC value, Xena value]: ")
+    print(mismatch_df.head(mismatch_rows).to_string(index = False))
+
+print("\n" + xena_file)
+print(" genes compared: " + str(len(genes)))
+if len(samples_passed) == len(samples):
+    print(" samples compared: ")
+    print(len(samples_passed))
+    print("Success")
+else:
+    print(" samples passed: " + str(len(samples_passed)) + "/" + str(len(samples)))
+    print("Failed")
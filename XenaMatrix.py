@@ -0,0 +1,231 @@
+'''
+XenaMatrix holds the functions that the validation scripts share for reading Xena matrices (a TSV file with genes as rows and
+samples as columns). Parsing a large matrix with pd.read_csv takes minutes, so loadMatrix() can keep a binary copy of every
+matrix it reads in a cache directory: the values as a raw float array in a .npy file (stored column by column so each sample
+is contiguous) and the gene and sample names in a json file. The next time the same matrix is loaded, the array is memory mapped
+instead of parsed, which takes almost no time. A cached copy is only used if the modified time and size of the TSV file are the
+same as when it was cached, otherwise it is built again. The copy is built from row chunks, so building it never needs more
+memory than one chunk.
+
+For matrices that are too wide to fit in memory, loadColumns() reads only the sample columns that are needed (from the cached copy
+if there is one, otherwise with the usecols option of pd.read_csv), and iterRows() reads the matrix a chunk of rows at a time.
+Both can return float32 values to halve the memory used.
+
+loadMatrices() parses several matrices at the same time in a pool of processes. Each process copies its values into a block of shared
+memory and only sends back the name of the block and the gene and sample names, so the values are never pickled.
+'''
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import ProcessPoolExecutor
+
+
+chunk_rows = 5000 # number of rows (genes) read at a time by iterRows() and when building a cached copy.
+
+shared_blocks = [] # shared memory blocks of the matrices returned by loadMatrices(), kept open for as long as the program runs.
+
+
+'''
+cacheEntry is the directory in cache_dir where the binary copy of xena_file is kept. It is named after the file name and a hash
+of its absolute path, so two matrices with the same name in different directories do not share an entry.
+'''
+def cacheEntry(xena_file, cache_dir):
+    full_path = os.path.abspath(xena_file)
+    key = hashlib.sha1(full_path.encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, os.path.basename(xena_file) + "_" + key)
+
+
+'''
+fileStamp is the modified time and size of a file, which tell us if a cached copy is out of date.
+'''
+def fileStamp(xena_file):
+    stat = os.stat(xena_file)
+    return {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+
+'''
+readCache opens the cached copy of xena_file as a dataframe, with the values memory mapped from disk. None is returned if there
+is no cached copy or if it is out of date.
+'''
+def readCache(xena_file, cache_dir):
+    entry = cacheEntry(xena_file, cache_dir)
+    try:
+        with open(os.path.join(entry, "meta.json")) as file:
+            meta = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+    if meta.get("stamp") != fileStamp(xena_file):
+        return None
+    values = np.load(os.path.join(entry, "values.npy"), mmap_mode = "r")
+    index = pd.Index(meta["index"], name = meta["index_name"])
+    columns = pd.Index(meta["columns"])
+    # values are stored in Fortran (column) order, so the dataframe can use the memory mapped array without copying it.
+    return pd.DataFrame(values, index = index, columns = columns, copy = False)
+
+
+'''
+readHeader reads the first line of xena_file and returns the name of the first column (the index) and the list of samples, in order.
+'''
+def readHeader(xena_file):
+    with open(xena_file, "r") as file:
+        line = file.readline()
+    names = [name.strip() for name in line.split("\t")]
+    return names[0], names[1:]
+
+
+'''
+readIndex reads only the first column of xena_file, which has the gene (row) names.
+'''
+def readIndex(xena_file):
+    index_name, samples = readHeader(xena_file)
+    index = pd.read_csv(xena_file, sep = '\t', usecols = [0], dtype = str).iloc[:, 0]
+    return pd.Index(index, name = index_name)
+
+
+'''
+iterRows reads xena_file rows_per_chunk rows at a time and yields each chunk as a dataframe indexed by gene. If samples is given, only
+those sample columns are read, in that order. dtype can be set to np.float32 to halve the memory of each chunk.
+'''
+def iterRows(xena_file, samples = None, rows_per_chunk = chunk_rows, dtype = None):
+    index_name, all_samples = readHeader(xena_file)
+    usecols = None
+    if samples != None:
+        usecols = [index_name] + list(samples)
+    dtypes = None
+    if dtype != None:
+        dtypes = {}
+        for sample in (samples if samples != None else all_samples):
+            dtypes[sample] = dtype
+    reader = pd.read_csv(xena_file, sep = '\t', index_col = 0, usecols = usecols, dtype = dtypes, chunksize = rows_per_chunk)
+    for chunk in reader:
+        if samples != None:
+            chunk = chunk[list(samples)]
+        yield chunk
+
+
+'''
+writeCache saves a binary copy of xena_file. The values are written a chunk of rows at a time into a memory mapped .npy file in
+column order, so the whole matrix is never in memory. It is written to a temporary directory first and then moved into place, so
+a half written copy is never read. Matrices with values that are not numbers are not cached.
+'''
+def writeCache(xena_file, cache_dir, stamp):
+    entry = cacheEntry(xena_file, cache_dir)
+    index = readIndex(xena_file)
+    index_name, columns = readHeader(xena_file)
+    temporary = entry + ".tmp" + str(os.getpid())
+    shutil.rmtree(temporary, ignore_errors = True)
+    os.makedirs(temporary)
+    values = np.lib.format.open_memmap(os.path.join(temporary, "values.npy"), mode = "w+", dtype = float,
+        shape = (len(index), len(columns)), fortran_order = True)
+    row = 0
+    for chunk in iterRows(xena_file):
+        numeric = all(pd.api.types.is_numeric_dtype(dtype) for dtype in chunk.dtypes)
+        if not numeric:
+            del values
+            shutil.rmtree(temporary, ignore_errors = True)
+            return False
+        values[row:row + len(chunk)] = chunk.to_numpy(dtype = float)
+        row = row + len(chunk)
+    values.flush()
+    del values
+    meta = {
+        "stamp": stamp,
+        "index_name": index_name,
+        "index": [str(gene) for gene in index],
+        "columns": columns
+    }
+    with open(os.path.join(temporary, "meta.json"), "w") as file:
+        json.dump(meta, file)
+    shutil.rmtree(entry, ignore_errors = True)
+    os.replace(temporary, entry)
+    return True
+
+
+'''
+loadMatrix reads a xena matrix into a dataframe with the first column as its index. When cache_dir is None the file is simply
+parsed with pd.read_csv. Otherwise the cached copy is used if it is up to date, and if not, it is built first. The values of a
+cached matrix are memory mapped, so only the parts that are used are read from disk. If the file changes while the copy is being
+built, the copy is out of date straight away and the file is parsed with pd.read_csv instead.
+'''
+def loadMatrix(xena_file, cache_dir = None):
+    if cache_dir == None:
+        return pd.read_csv(xena_file, sep = '\t', index_col = 0)
+    os.makedirs(cache_dir, exist_ok = True)
+    xena_df = readCache(xena_file, cache_dir)
+    if xena_df is not None:
+        return xena_df
+    stamp = fileStamp(xena_file) # taken before parsing, so a file that changes while it is parsed is cached as out of date.
+    if writeCache(xena_file, cache_dir, stamp) == False:
+        return pd.read_csv(xena_file, sep = '\t', index_col = 0)
+    xena_df = readCache(xena_file, cache_dir)
+    if xena_df is None: # the file changed while it was cached, so the copy is already out of date.
+        return pd.read_csv(xena_file, sep = '\t', index_col = 0)
+    return xena_df
+
+
+'''
+loadColumns reads only the columns of samples from xena_file, in that order. With cache_dir the columns are copied out of the memory
+mapped copy, which only touches the bytes of those samples. Without it, pd.read_csv parses only those columns (usecols), though it
+still has to scan the whole file. dtype can be set to np.float32 to halve the memory used.
+'''
+def loadColumns(xena_file, samples, cache_dir = None, dtype = None):
+    samples = list(samples)
+    if cache_dir != None:
+        xena_df = loadMatrix(xena_file, cache_dir)
+        columns = xena_df[samples]
+        if dtype != None:
+            return columns.astype(dtype)
+        return columns.copy()
+    index_name, all_samples = readHeader(xena_file)
+    dtypes = None
+    if dtype != None:
+        dtypes = dict.fromkeys(samples, dtype)
+    columns = pd.read_csv(xena_file, sep = '\t', index_col = 0, usecols = [index_name] + samples, dtype = dtypes)
+    return columns[samples]
+
+
+'''
+parseShared runs in a worker process of loadMatrices(). It parses xena_file, copies the values (in column order) into a new block of shared
+memory and returns what the parent needs to use the block: its name, the shape and dtype of the values and the gene and sample names.
+'''
+def parseShared(xena_file, dtype = None):
+    xena_df = pd.read_csv(xena_file, sep = '\t', index_col = 0)
+    values = xena_df.to_numpy(dtype = dtype if dtype != None else float)
+    block = shared_memory.SharedMemory(create = True, size = max(values.nbytes, 1))
+    shared = np.ndarray(values.shape, dtype = values.dtype, buffer = block.buf, order = "F")
+    shared[:] = values
+    del shared
+    block.close()
+    return block.name, values.shape, values.dtype.str, xena_df.index.name, list(xena_df.index), list(xena_df.columns)
+
+
+'''
+attachShared opens the shared memory block returned by parseShared() as a dataframe without copying it. The block is unlinked straight
+away, so it is freed when the program exits even if it crashes, and kept open in shared_blocks so the values stay valid.
+'''
+def attachShared(result):
+    name, shape, dtype, index_name, index, columns = result
+    block = shared_memory.SharedMemory(name = name)
+    shared_blocks.append(block)
+    block.unlink()
+    values = np.ndarray(shape, dtype = dtype, buffer = block.buf, order = "F")
+    return pd.DataFrame(values, index = pd.Index(index, name = index_name), columns = columns, copy = False)
+
+
+'''
+loadMatrices parses every file in xena_files at the same time with up to 'workers' processes and returns their dataframes in the same
+order. Parsing is limited by the CPU, so processes are used instead of threads. A script that calls this must run its own code under
+if __name__ == "__main__":, since on macOS and Windows each worker process imports the script again.
+'''
+def loadMatrices(xena_files, workers, dtype = None):
+    resource_tracker.ensure_running() # the workers share the tracker of this process, which is told when the blocks are unlinked.
+    xena_dfs = []
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        for result in pool.map(parseShared, xena_files, [dtype] * len(xena_files)):
+            xena_dfs.append(attachShared(result))
+    return xena_dfs
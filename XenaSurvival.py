@@ -0,0 +1,74 @@
+'''
+XenaSurvival holds the comparison that the two survival validation scripts share. Both of them build a dataframe of the survival
+data of a project from the GDC, with one row per case (patient), and read the Xena survival matrix, which has one row per sample.
+comparison() joins the two on the _PATIENT column, so every sample row of the matrix is checked against the values of its case.
+'''
+
+import pandas as pd
+
+
+sample_column = "sample" # column of the xena survival matrix with the sample of each row
+
+
+'''
+comparison compares the GDC dataframe 'gdc' with the xena dataframe 'xena'. column holds the names of the OS_time, OS and
+_PATIENT columns, in that order. The GDC data should have one row per case, so a case in more than one of its rows is printed
+and only its first row is kept. The xena matrix has one row per sample, so a case with several samples has several rows, and the
+two dataframes are joined once with an outer merge where every xena row is matched to the single GDC row of its case. The OS_time
+and OS columns of the joined rows are then compared as whole columns, where two missing values count as equal. Rows with different
+values, cases that are only in the GDC data (missing from the xena file) and rows whose case is only in the xena file are printed.
+'excluded' is a list of submitter ids that were left out of the GDC data on purpose (such as cases with an OS_time of 0 or less);
+if the xena file has them they are printed on their own and do not fail the comparison. True is returned only if every other case
+is in both and all of the values of every sample row match.
+'''
+def comparison(gdc, xena, column, excluded = []):
+    duplicated = gdc[gdc.duplicated(subset = column[2], keep = False)]
+    if len(duplicated) > 0: # a case in more than one GDC row would be joined to every one of them, so only its first row is kept.
+        print("\nCases that appear more than once in the GDC data, only the first row is compared:")
+        print(duplicated[column].to_string(index = False))
+        gdc = gdc.drop_duplicates(subset = column[2])
+    xena_keys = [column[2]] # columns of the xena rows that are printed
+    if sample_column in xena.columns:
+        xena_keys = [sample_column, column[2]]
+    merged = pd.merge(xena[xena_keys + column[:2]], gdc[column], on = column[2], how = "outer", suffixes = ("_xena", "_gdc"),
+        indicator = True, validate = "many_to_one")
+    both = merged[merged["_merge"] == "both"]
+    gdc_only = merged[merged["_merge"] == "right_only"]
+    xena_only = merged[merged["_merge"] == "left_only"]
+    xena_excluded = xena_only[xena_only[column[2]].isin(excluded)] # cases left out of the GDC data on purpose
+    xena_only = xena_only[~xena_only[column[2]].isin(excluded)]
+    same = {} # for each of OS_time and OS, whether the GDC and xena values of every joined row are equal
+    for name in column[:2]:
+        gdc_values = both[name + "_gdc"]
+        xena_values = both[name + "_xena"]
+        same[name] = (gdc_values == xena_values) | (gdc_values.isna() & xena_values.isna())
+    os_time_compare = int(same[column[0]].sum()) # number of rows with the same OS_time
+    os_compare = int(same[column[1]].sum()) # number of rows with the same OS
+    mismatches = both[~(same[column[0]] & same[column[1]])]
+    gdc_columns = [column[2], column[0] + "_gdc", column[1] + "_gdc"]
+    xena_columns = xena_keys + [column[0] + "_xena", column[1] + "_xena"]
+    if len(mismatches) > 0:
+        print("\nRows with different values [" + ", ".join(xena_keys) + ", GDC OS_time, Xena OS_time, GDC OS, Xena OS]:")
+        print(mismatches[xena_keys + [column[0] + "_gdc", column[0] + "_xena", column[1] + "_gdc", column[1] + "_xena"]].to_string(index = False))
+    if len(gdc_only) > 0:
+        print("\nCases missing from survival data matrix [Submitter_id, OS_time, OS]:")
+        print(gdc_only[gdc_columns].to_string(index = False))
+    if len(xena_only) > 0:
+        print("\nRows in survival data matrix whose case is not in the GDC data [" + ", ".join(xena_keys) + ", OS_time, OS]:")
+        print(xena_only[xena_columns].to_string(index = False))
+    if len(xena_excluded) > 0:
+        print("\nRows in survival data matrix whose case was left out of the GDC data, they are not compared [" + ", ".join(xena_keys) + ", OS_time, OS]:")
+        print(xena_excluded[xena_columns].to_string(index = False))
+    if len(mismatches) == 0 and len(gdc_only) == 0 and len(xena_only) == 0:
+        print("\nsuccess!")
+        print("number of cases successfully compared: " + str(both[column[2]].nunique()))
+        print("number of sample rows successfully compared: " + str(len(both)))
+        return True
+    # otherwise the comparison fails.
+    print("\nFailed")
+    print("\nSample rows successfully compared:" + str(len(both) - len(mismatches)) + "/" + str(len(both) + len(xena_only)))
+    print("\nNumber of sample rows where vital status was identical: " + str(os_compare))
+    print("\nNumber of sample rows where time was identical: " + str(os_time_compare))
+    print("\nCases missing from survival data matrix: " + str(len(gdc_only)))
+    print("\nCases only in survival data matrix: " + str(xena_only[column[2]].nunique()))
+    return False
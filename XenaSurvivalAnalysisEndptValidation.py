@@ -4,6 +4,8 @@ import sys
 import pandas as pd
 import numpy as np
 import sys
+import GDCQuery
+import XenaSurvival
 '''
 Xena Survival Analysis Endpt Validation works very similarily to Xena Survival Matrix Validation. The major difference 
 between the two is that this script uses the /analysis/survival endpoint instead of the /cases endpoint to retrieve
@@ -117,8 +119,8 @@ def getData(endpt, keys, project): # /analysis/survival endpoint is used. Projec
 	print(submitter_id)
 
 '''
-getStatus uses the cases endpoint in order to independently retrieve OS data from all cases of a project. After getting the json 
-response and turning it into a list, we iterate through each element in the list. First we find the submitter_ids that we will use 
+getStatus uses the cases endpoint in order to independently retrieve OS data from all cases of a project. The submitter ids are sent
+in chunks and every page of the response is requested with GDCQuery.fetchHits(), which returns all of the cases as a list. We iterate through each element in the list. First we find the submitter_ids that we will use 
 for mapping the data to match data from getData(). Then we iterate again in order to get the OS data, which is put in the vital_status
 list in the correct order.
 '''
@@ -132,32 +134,11 @@ def getStatus(endpt, fields, submitter_id, filter_field, keys): #cases endpt, fi
 	for key, value in submitter_id_dict.items():
 		submitter_id_dict[key] = index # each value is given an index which increases by one as we go through the loop.
 		index +=1
-	fields = ",".join(fields) #fields need to be a comma seperated string
-	filters = {
-        "op": "in",
-        "content":{
-            "field": filter_field, 
-            "value": submitter_id
-			}
-        
-	}
+	# the submitter ids are split into chunks of GDCQuery.filter_chunk, so no single request carries the whole list.
+	filters = GDCQuery.chunkFilters(filter_field, submitter_id)
 
-	# A POST is used, so the filter parameters can be passed directly as a Dict object.
-	params = {
-    	"filters": filters,
-    	"fields": fields,
-    	"format": "json",
-    	"size": "2000"
-    	}
-
-	# The parameters are passed to 'json' rather than 'params' in this case
-	response = requests.post(endpt, headers = {"Content-Type": "application/json"}, json = params)
-
-	responseJson = json.dumps(response.json(),indent=2)
-	#responseJson is a json format dict. 
-	responseJson = json.loads(responseJson)
-	responseJson = responseJson.get("data")
-	responseJson = responseJson.get("hits")
+	# every page of every chunk is requested, a few at a time, and the cases are merged into one list.
+	responseJson = GDCQuery.fetchHits(endpt, filters, fields)
 	#responseJson is now a list
 	for i in responseJson: # iterate through each element (case) in list. Each elements is a dictionary.
 		mapping_index = None # create mapping_index variable
@@ -198,48 +179,6 @@ The same is done with the xena TSV file
 def xenaFormat(file_name):
 	xena_format = pd.read_csv(file_name, sep= '\t')
 	return xena_format # xena_format is dataframe
-'''
-comparison compares both dataframes. The GDC imported dataframe is named 'gdc', the xena dataframe is named 'xena'. However, the two dataframes are in different orders.
-So the first thing that is done is to match each row (case) in the GDC data to a row in the Xena data. This is done by using the submitter_ids to map one case onto another. Afterwards,
-the two dataframes are compared on a cell to cell basis. If a cell in the 'OS_time' column matches, a marker for OS_time increases by one. The same is true for the 'OS' column. Once all 
-cells have been compared, the 'OS_time_compare' is compared with 'OS_compare' and the length of 'gdc'. If all three are equal, the program is successful, otherwise, the program fails. 
-A list of missing cases, their submitter_id, OS_time, and OS is also printed. 
-'''
-def comparison(gdc, xena, column):
-	os_time_compare = 0 #used to track successful OS_time comparisons
-	os_compare = 0 #used to track successful OS comparisons.
-	missing_list = [] # cases that are missing from the xena file are appended to this list.
-	for cell in range(len(gdc.index)): # cell is a marker that goes through each row of 'gdc'. 
-		search = gdc.loc[cell, column[2]] # search is a string that corresponds to specified row's submitter_id
-		if (xena[column[2]].eq(search)).any() == True: # check if that submitter_id exists in the 'xena' dataframe. If so, compare the other two columns. 
-			row, col = np.where(xena == search) #finds row and column where submitter_id is located in 'xena'
-			xena_time = xena.loc[row[0], column[0]] #xena_time corresponds to the OS_time at specified row and column named 'OS_time'
-			gdc_time = gdc.loc[cell, column[0]] # gdc_time corresponds to the OS_time value at row 'cell'.
-			xena_status = xena.loc[row[0], column[1]] # xena_status is the OS value at the specified row (based on submitter_id)
-			gdc_status = gdc.loc[cell,column[1]]# gdc_status corresponds to the OS value at row 'cell'.
-			if xena_time == gdc_time: #check if the two OS_times are equivalant. 
-				os_time_compare += 1
-			if xena_status == gdc_status: # check if the two OSs are equivalent.
-				os_compare += 1
-		else:   # if 'search' (submitter_id) does not exist, then the case is missing from the xena file
-			print("\nCase is missing from survival data matrix (submitter_id):")
-			print(search)
-			print("\n" + column[0] + " value:")
-			print(gdc.loc[cell, column[0]])
-			print("\n" + column[1] + " value:")
-			print(gdc.loc[cell, column[1]])
-			case_info = [search, gdc.loc[cell, column[0]], gdc.loc[cell, column[1]]] # the survival data on the case is then saved to 'missing_list'.
-			missing_list.append(case_info)
-	if os_compare == len(gdc.index) and os_time_compare: # Checks if OS_time_compare and OS_compare are equivalent to the length of the 'gdc' dataframe.
-		print("\nsuccess!")
-		print("number of cases successfully compared: " + str(os_compare))
-	else:     # if they are not equivalent the program fails. 
-		print("\nFailed")
-		print("\nCases successfully compared:" + str(os_compare) + "/" + str(len(gdc.index)))
-		print("\nList of missing cases [Submitter_id, OS_time, OS]:")
-		print(missing_list)
-		print("\nNumber of cases where vital status was identitcal: " + str(os_compare))
-		print("\n number of cases where time was identitcal: " + str(os_time_compare))
 
 #gets the OS_time data and submitter_ids of a project using a post request.
 getData(survival_endpt, survival_keys, project_id)
@@ -256,5 +195,5 @@ print(xena_df)
 print(gdc_df)
 
 # The two dataframes are compared and any missing cases or incorrect data is printed out at the end. 
-comparison(gdc_df, xena_df, column_names)
+XenaSurvival.comparison(gdc_df, xena_df, column_names)
 